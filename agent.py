@@ -1,27 +1,91 @@
+import time
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import numpy as np
 from game import *
+from batch import BatchGame
+from profiling import PROFILER
+from encoding import STATE_SIZE, ME, ADV, GRILL, encode_state, encode_states, decode_states
 
 HID_SIZE = 10
-STATE_SIZE = 16*3
 
 GAMMA = 1
 LR = 0.001
 LOSS_AB = 10
 N_SIMU = 3
+GRID = np.logspace(-2, 1, 10)
 
 def state2tensor(grill, me, adv):
-    return torch.tensor(grill + me + [0]*(16-len(me)) + adv  + [0]*(16-len(adv)), dtype=torch.float32)
+    return torch.from_numpy(encode_state(np.zeros(STATE_SIZE, dtype=np.float32), grill, me, adv))
 
 def tensor2state(vec):
     res = vec.tolist()
-    grill = res[0:16]
-    me = res[16:32]
-    adv = res[32:48]
+    grill = res[GRILL]
+    me = res[ME]
+    adv = res[ADV]
     return grill, [x for x in me if x], [x for x in adv if x]
 
+def tensor2states(batch: torch.Tensor):
+    """Decodes a batch of states
+
+    :param batch: states of shape (N, STATE_SIZE)
+    :type batch: torch.Tensor
+    :return: (grill (N, 16) bool, stacks of me (N, 16), stacks of adv (N, 16), heights of the stacks (N, 2)), stacks padded with 0
+    :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+    """
+    return decode_states(batch.detach().cpu().numpy())
+
+
+class StateEncoder:
+    """Encodes game states into a preallocated tensor reused from one call to the next.
+
+    The tensors returned are views of the buffer: they are only valid until the next call, so a state
+    used for a backward pass must be encoded by its own encoder.
+
+    :param capacity: initial number of states of the buffer, grown when needed
+    :type capacity: int
+    """
+
+    def __init__(self, capacity: int = 1) -> None:
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        self.buffer = torch.zeros((capacity, STATE_SIZE), dtype=torch.float32)
+        self.array = self.buffer.numpy() # shares the memory of the buffer
+
+    def encode(self, grill: list, me: list, adv: list) -> torch.Tensor:
+        """Encodes a state given as in Game, same layout as state2tensor
+
+        :return: state of shape (STATE_SIZE,)
+        :rtype: torch.Tensor
+        """
+        encode_state(self.array[0], grill, me, adv)
+        return self.buffer[0]
+
+    def encode_batch(self, grill: np.ndarray, me: np.ndarray, adv: np.ndarray) -> torch.Tensor:
+        """Encodes a batch of states given as arrays, the stacks being padded with 0
+
+        :param grill: available dominos, shape (N, 16)
+        :type grill: np.ndarray
+        :param me: stacks of the player, shape (N, 16)
+        :type me: np.ndarray
+        :param adv: stacks of the adversary, shape (N, 16)
+        :type adv: np.ndarray
+        :return: states of shape (N, STATE_SIZE)
+        :rtype: torch.Tensor
+        """
+        n = len(grill)
+        if n > len(self.array):
+            self._allocate(n)
+        encode_states(self.array, grill, me, adv)
+        return self.buffer[:n]
+
+    def encode_games(self, batch: BatchGame, side: int = 0) -> torch.Tensor:
+        """Encodes the states of all the games of a BatchGame from the point of view of the given side"""
+        return self.encode_batch(batch.grill, batch.stacks[:, side], batch.stacks[:, 1 - side])
+
+
 class Actor(nn.Module):
     def __init__(self):
         super(Actor, self).__init__()
@@ -53,39 +117,54 @@ class Agent():
         self.me = PlayerAB()
         self.adv = PlayerAB()
         self.game = Game(self.me, self.adv)
+        self.rng = np.random.default_rng()
+        self.encoder = StateEncoder()
+
+    def grid_search(self, alphas, betas) -> np.ndarray:
+        """Evaluates every (alpha, beta) candidate for self.me from the current position of the game.
+
+        All the candidates and their N_SIMU rollouts (a turn of self.me then a turn of self.adv) are played
+        in one BatchGame from a single snapshot of the game, and the values of the resulting states are
+        computed by a single forward of the network.
+
+        :param alphas: candidate alphas
+        :type alphas: array_like
+        :param betas: candidate betas
+        :type betas: array_like
+        :return: expected reward + GAMMA*value of the next state, shape (len(alphas), len(betas))
+        :rtype: np.ndarray
+        """
+        alpha_grid, beta_grid = np.meshgrid(alphas, betas, indexing="ij")
+        n_games = alpha_grid.size*N_SIMU
+        batch = BatchGame(n_games, rng=self.rng)
+        batch.set_ab(np.column_stack((np.repeat(alpha_grid.ravel(), N_SIMU), np.full(n_games, self.adv.alpha))),
+                     np.column_stack((np.repeat(beta_grid.ravel(), N_SIMU), np.full(n_games, self.adv.beta))))
+        batch.load(self.game.grill, self.me.dominos, self.adv.dominos)
+
+        reward = batch.play_turn(0)
+        reward -= batch.play_turn(1)
+        new_states = self.encoder.encode_games(batch)
+        if PROFILER.enabled:
+            tic = time.perf_counter()
+        with torch.no_grad():
+            _, _, new_val = self.net(new_states)
+        if PROFILER.enabled:
+            PROFILER.add("forward", tic)
+        res = reward + GAMMA*new_val[:, 0].numpy()
+        return res.reshape(alpha_grid.size, N_SIMU).mean(axis=1).reshape(alpha_grid.shape)
 
     def simulator(self, alpha, beta) -> torch.Tensor:
-        save_grill = self.game.grill.copy()
-        save_me = self.me.dominos.copy()
-        save_adv = self.adv.dominos.copy()
-        self.me.set_ab(alpha, beta)
-
-        res = 0
-
-        for _ in range(N_SIMU):
-            reward = self.game.play_turn(self.me, self.adv)
-            reward -= self.game.play_turn(self.adv, self.me)
-            new_state = state2tensor(self.game.grill, self.me.dominos, self.adv.dominos)
-
-            with torch.no_grad():
-                _, _, new_val = self.net(new_state)
-            res += reward + GAMMA*new_val[0]
-
-            self.game.grill = save_grill.copy()
-            self.me.dominos = save_me.copy()
-            self.adv.dominos = save_adv.copy()
-
-        return res / N_SIMU
+        return torch.tensor(self.grid_search([alpha], [beta])[0, 0])
 
 if __name__ == "__main__":
 
-    #Logging
-    log_path = 'game.log'
+    #Tracing
+    trace_path = 'game.trace'
     try:
-        os.remove(log_path)
+        os.remove(trace_path)
     except OSError:
         pass
-    logging.basicConfig(filename=log_path, level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    TRACER.enable(BinaryFile(trace_path))
 
     # Initialize the network and optimizer
     net = Actor()
@@ -93,6 +172,8 @@ if __name__ == "__main__":
 
     optimizer = optim.SGD(agent.net.parameters(), lr=LR)
 
+    encoder = StateEncoder()
+
     # Training loop
     for epoch in range(10):
         
@@ -100,7 +181,7 @@ if __name__ == "__main__":
 
         while not agent.game.over():
 
-            state = state2tensor(agent.game.grill, agent.me.dominos, agent.adv.dominos)
+            state = encoder.encode(agent.game.grill, agent.me.dominos, agent.adv.dominos)
             alpha, beta, val = agent.net(state)
             agent.me.set_ab(alpha.item(), beta.item())
 
@@ -110,16 +191,11 @@ if __name__ == "__main__":
             print(f"step done {alpha.item():.2f} - {beta.item():.2f} : {val.item():.2f} with reward {reward}")
 
             # Simulate
-            max_val = None
-            best_alpha = None
-            best_beta = None
-            for a in np.logspace(-2, 1, 10):
-                for b in np.logspace(-2, 1, 10):
-                    v = agent.simulator(a, b)
-                    if max_val == None or v > max_val:
-                        max_val = v
-                        best_alpha = a
-                        best_beta = b
+            values = agent.grid_search(GRID, GRID)
+            best_idx, best_jdx = np.unravel_index(np.argmax(values), values.shape)
+            max_val = values[best_idx, best_jdx]
+            best_alpha = GRID[best_idx]
+            best_beta = GRID[best_jdx]
             print(f"simu done {best_alpha:.2f} - {best_beta:.2f} : {max_val:.2f}")
 
             # Loss
@@ -130,3 +206,5 @@ if __name__ == "__main__":
             print(f"optimization done: loss = {loss.item()}")
 
         print(f"Epoch {epoch+1}, Loss: {loss.item()}")
+
+    TRACER.disable()
@@ -0,0 +1,269 @@
+import time
+import numpy as np
+from tools import *
+from tables import STORE, turn_graph
+from profiling import PROFILER
+
+
+class BatchGame:
+    """Plays a batch of games in lockstep between two PlayerAB.
+
+    The state of all the games is stored in arrays: grill (n_games, n_dominos), stacks (n_games, 2, n_dominos)
+    and heights of the stacks (n_games, 2). Side 0 is player A and side 1 is player B. Each turn follows
+    Game.play_turn with PlayerAB decisions, the dice decisions being looked up in the shared strategy tables.
+    Both players use the rewards r of the game.
+
+    With 8 dice and the default STORE.maxsize of 4096, BatchGame plays about 3600 games/s with 1000 games and
+    5700 games/s with 10000 games, against about 740 games/s for Game with warm tables: 5 to 8 times faster, not
+    the hundred times first aimed at (5000 and 12500 games/s with STORE.maxsize = 65536). Each turn of the batch
+    needs one strategy table per distinct (C, stop rewards) of its games, which depend on the grill and on both
+    stacks: with 10000 games, about 2000 tables per turn. Looking them up and solving the new ones
+    (STORE.get_many) takes about half of the time once the store keeps the tables from one turn to the next,
+    and most of it with the default store, which is too small for that. The rest is the loop over the throws of
+    a turn, a few dozen NumPy operations on arrays of (games, faces) per throw.
+
+    :param n_games: number of games played at once
+    :type n_games: int
+    :param alphas: alpha of both players, shape (2,) or (n_games, 2)
+    :type alphas: array_like
+    :param betas: beta of both players, shape (2,) or (n_games, 2)
+    :type betas: array_like
+    :param rng: random generator used to draw the dice
+    :type rng: np.random.Generator, optional
+    :param dice: source of the dice, replaces rng
+    :type dice: DiceSource, optional
+    """
+
+    def __init__(self, n_games: int, alphas=(1, 1), betas=(1, 1), N_dice = 8, domino_min = 21, domino_max = 36, r = [1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4], rng: np.random.Generator = None, dice: DiceSource = None) -> None:
+        self.n_games = n_games
+        self.N_dice = N_dice
+        self.domino_min = domino_min
+        self.domino_max = domino_max
+        self.n_dominos = domino_max - domino_min + 1
+        self.r = np.asarray(r, dtype=np.float64)
+        self.dice = dice if dice is not None else DiceSource(rng if rng is not None else np.random.default_rng())
+        self.set_ab(alphas, betas)
+        self.reinit()
+
+    def set_ab(self, alphas, betas) -> None:
+        self.alphas = np.broadcast_to(np.asarray(alphas, dtype=np.float64), (self.n_games, 2)).copy()
+        self.betas = np.broadcast_to(np.asarray(betas, dtype=np.float64), (self.n_games, 2)).copy()
+
+    def reinit(self) -> None:
+        self.grill = np.ones((self.n_games, self.n_dominos), dtype=bool)
+        self.stacks = np.zeros((self.n_games, 2, self.n_dominos), dtype=np.int64)
+        self.heights = np.zeros((self.n_games, 2), dtype=np.int64)
+
+    def load(self, grill: list, dominos_A: list, dominos_B: list) -> None:
+        """Puts all the games in the same position, given as in Game
+
+        :param grill: available dominos
+        :type grill: list[bool]
+        :param dominos_A: stack of player A, top last
+        :type dominos_A: list[int]
+        :param dominos_B: stack of player B, top last
+        :type dominos_B: list[int]
+        """
+        self.grill[:] = np.asarray(grill, dtype=bool)
+        self.stacks[:] = 0
+        self.stacks[:, 0, :len(dominos_A)] = dominos_A
+        self.stacks[:, 1, :len(dominos_B)] = dominos_B
+        self.heights[:] = (len(dominos_A), len(dominos_B))
+
+    def over(self) -> np.ndarray:
+        return(~self.grill.any(axis=1))
+
+    def top(self, side: int) -> np.ndarray:
+        """Returns the domino on the top of the stack of the given side in each game, 0 if the stack is empty"""
+        heights = self.heights[:, side]
+        return(np.where(heights > 0, self.stacks[np.arange(self.n_games), side, np.maximum(heights - 1, 0)], 0))
+
+    def score(self) -> np.ndarray:
+        """Returns the score of both players in each game, shape (n_games, 2)"""
+        rewards = np.concatenate(([0.], self.r))
+        dominos = np.where(self.stacks > 0, self.stacks - self.domino_min + 1, 0)
+        return(rewards[dominos].sum(axis=2))
+
+    def score_difference(self) -> np.ndarray:
+        scores = self.score()
+        return(scores[:, 0] - scores[:, 1])
+
+    def turn_rewards(self, side: int, games: np.ndarray):
+        """Computes the rewards used by the playing players at the beginning of their turn, as PlayerAB.init_turn
+
+        :param side: playing side
+        :type side: int
+        :param games: indices of the games played
+        :type games: np.ndarray
+        :return: (C, reward of each domino, reward of stopping with each score), shapes (k,), (k, n_dominos), (k, 5*N_dice+1)
+        :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        """
+        top_me = self.top(side)[games]
+        top_adv = self.top(1 - side)[games]
+        C = np.where(top_me > 0, self.alphas[games, side]*self.r[np.maximum(top_me - self.domino_min, 0)], 0.)
+        r_player = np.where(self.grill[games], self.r[None, :], -C[:, None])
+
+        scores = np.arange(5*self.N_dice + 1)
+        best_domino = np.maximum.accumulate(r_player, axis=1)[:, np.clip(scores - self.domino_min, 0, self.n_dominos - 1)]
+        stop_rewards = np.where(scores[None, :] < self.domino_min, -C[:, None], best_domino)
+        steal_reward = 2*self.r[np.maximum(top_adv - self.domino_min, 0)]*self.betas[games, side]
+        stealing = (scores[None, :] == top_adv[:, None]) & (top_adv > 0)[:, None]
+        stop_rewards = np.where(stealing, steal_reward[:, None], stop_rewards)
+        return(C, r_player, stop_rewards)
+
+    def play_dice_part(self, games: np.ndarray, C: np.ndarray, stop_rewards: np.ndarray):
+        """Plays the dice part of a turn in all the given games
+
+        The dice of every possible throw of the turn are drawn at once for all the games of the batch, so
+        the dice of a game at a given (turn, throw) do not depend on what happens in the other games.
+        Two batches with the same seed thus share their random numbers game by game.
+
+        :param games: indices of the games played
+        :type games: np.ndarray
+        :param C: C of the playing players
+        :type C: np.ndarray
+        :param stop_rewards: reward of stopping with each score for the playing players
+        :type stop_rewards: np.ndarray
+        :return: (score, failed)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        n = len(games)
+        keys = np.ascontiguousarray(np.column_stack((-C, stop_rewards)))
+        # Rows are compared as raw bytes, which is much faster than np.unique(axis=0)
+        _, first, table_idx = np.unique(keys.view(np.dtype((np.void, keys.itemsize*keys.shape[1]))).ravel(), return_index=True, return_inverse=True)
+        if PROFILER.enabled:
+            tic = time.perf_counter()
+        tables = np.stack([table.compact_values for table in STORE.get_many([(self.N_dice, key[0], tuple(key[1:])) for key in keys[first].tolist()])])
+        if PROFILER.enabled:
+            PROFILER.add("table_lookup", tic)
+        graph = turn_graph(self.N_dice)
+
+        faces = np.arange(N_FACES)
+        dice = np.arange(self.N_dice)
+        # At most one throw per face plus the throw where the turn is failed
+        rolls = self.dice.rolls((self.n_games, N_FACES + 1, self.N_dice))[games]
+        throw = 0
+        choices = np.zeros(n, dtype=np.int64)
+        nb_available_dice = np.full(n, self.N_dice)
+        score = np.zeros(n, dtype=np.int64)
+        failed = np.zeros(n, dtype=bool)
+        active = np.ones(n, dtype=bool)
+        while active.any():
+            idx = np.flatnonzero(active)
+            if PROFILER.enabled:
+                PROFILER.count("throws", len(idx))
+            thrown = dice[None, :] < nb_available_dice[idx, None]
+            # Number of dice of each face, counted in one pass over the dice thrown in all the games
+            cells = np.arange(len(idx))[:, None]*N_FACES + rolls[idx, throw]
+            counts = np.bincount(cells[thrown], minlength=len(idx)*N_FACES).reshape(len(idx), N_FACES)
+            throw += 1
+            new_choices = choices[idx, None] | (1 << faces)
+            new_scores = score[idx, None] + FACE_VALUES*counts
+            remaining = nb_available_dice[idx, None] - counts
+
+            states = graph.compact[(new_choices*(self.N_dice + 1) + remaining)*(5*self.N_dice + 1) + new_scores]
+            continuing = tables[table_idx[idx, None], states]
+            stopping_reward = stop_rewards[idx[:, None], new_scores]
+            stopping = (new_choices % 2 == 1) & (stopping_reward >= continuing)
+            reward = np.where(stopping, stopping_reward, continuing)
+            allowed = (counts > 0) & (((choices[idx, None] >> faces) & 1) == 0)
+            reward[~allowed] = -np.inf
+            # Same tie-breaking as StrategyTable.strategy: the last best face is chosen
+            face = N_FACES - 1 - np.argmax(reward[:, ::-1], axis=1)
+
+            can_choose = allowed.any(axis=1)
+            failed[idx[~can_choose]] = True
+            active[idx[~can_choose]] = False
+
+            rows = np.flatnonzero(can_choose)
+            games = idx[rows]
+            face = face[rows]
+            score[games] = new_scores[rows, face]
+            choices[games] = new_choices[rows, face]
+            stops = stopping[rows, face]
+            active[games[stops]] = False
+            nb_available_dice[games[~stops]] = remaining[rows, face][~stops]
+        return(score, failed)
+
+    def play_turn(self, side: int) -> np.ndarray:
+        """Plays a turn in every game which is not over, as Game.play_turn
+
+        :param side: playing side
+        :type side: int
+        :return: reward of the playing player in each game (0 for the games over)
+        :rtype: np.ndarray
+        """
+        rewards = np.zeros(self.n_games)
+        games = np.flatnonzero(~self.over())
+        if not len(games):
+            return(rewards)
+        if PROFILER.enabled:
+            PROFILER.count("turns", len(games))
+            tic = time.perf_counter()
+        C, r_player, stop_rewards = self.turn_rewards(side, games)
+        score, failed = self.play_dice_part(games, C, stop_rewards)
+        if PROFILER.enabled:
+            PROFILER.add("batch_dice_part", tic)
+            tic = time.perf_counter()
+
+        # Grill part
+        top_adv = self.top(1 - side)[games]
+        steal = ~failed & (score == top_adv) & (top_adv > 0)
+        selectable = np.arange(self.n_dominos)[None, :] <= (score - self.domino_min)[:, None]
+        selection = np.argmax(np.where(selectable, r_player, -np.inf), axis=1)
+        take = (~failed & ~steal & (score >= self.domino_min)
+                & (r_player[np.arange(len(games)), selection] > 0) & self.grill[games, selection])
+        lose = ~steal & ~take
+        if PROFILER.enabled:
+            PROFILER.count("steals", int(steal.sum()))
+
+        g = games[steal]
+        h_adv = self.heights[g, 1 - side] - 1
+        self.stacks[g, side, self.heights[g, side]] = self.stacks[g, 1 - side, h_adv]
+        self.stacks[g, 1 - side, h_adv] = 0
+        self.heights[g, side] += 1
+        self.heights[g, 1 - side] -= 1
+        rewards[g] = 2*self.r[score[steal] - self.domino_min]
+
+        g = games[take]
+        self.stacks[g, side, self.heights[g, side]] = selection[take] + self.domino_min
+        self.heights[g, side] += 1
+        self.grill[g, selection[take]] = False
+        rewards[g] = self.r[selection[take]]
+
+        g = games[lose]
+        has_domino = self.heights[g, side] > 0
+        g_lost = g[has_domino]
+        h_me = self.heights[g_lost, side] - 1
+        rewards[g_lost] = -self.r[self.stacks[g_lost, side, h_me] - self.domino_min]
+        self.stacks[g_lost, side, h_me] = 0
+        self.heights[g_lost, side] -= 1
+        # The highest domino of the grill is flipped
+        highest = self.n_dominos - 1 - np.argmax(self.grill[g, ::-1], axis=1)
+        self.grill[g, highest] = False
+        if PROFILER.enabled:
+            PROFILER.add("batch_grill_part", tic)
+        return(rewards)
+
+    def play_game(self) -> None:
+        """Plays all the games until they are over, player A playing first"""
+        side = 0
+        if PROFILER.enabled:
+            PROFILER.count("games", int((~self.over()).sum()))
+        while not self.over().all():
+            self.play_turn(side)
+            side = 1 - side
+
+
+if __name__ == "__main__":
+
+    import time
+
+    batch = BatchGame(1000, rng=np.random.default_rng(0))
+    for i in range(3):
+        batch.reinit()
+        tic = time.time()
+        batch.play_game()
+        toc = time.time() - tic
+        print(f"{batch.n_games/toc:.0f} games/s, average score difference: {batch.score_difference().mean():.3f}")
+    print(f"Strategy tables: {STORE.stats()}")
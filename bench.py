@@ -0,0 +1,231 @@
+"""Benchmark suite of the engine.
+
+Measures the solve time of a turn, the speed of the games, the latency of a step of the agent and the memory
+growth over a long evolution run, writes the results in a JSON file and compares them with a baseline:
+
+    python bench.py --output bench.json --baseline bench_baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from tools import *
+from players import PlayerAB
+from game import Game
+from tables import STORE, turn_graph
+
+
+def measure(fun, repeat: int) -> dict:
+    """Calls fun repeat times and returns the best and median durations in seconds"""
+    durations = []
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        fun()
+        durations.append(time.perf_counter() - tic)
+    return {"best": min(durations), "median": float(np.median(durations))}
+
+
+def rss() -> float:
+    """Returns the resident memory of the process in MB"""
+    try:
+        with open("/proc/self/statm") as file:
+            return(int(file.read().split()[1])*os.sysconf("SC_PAGE_SIZE")/2**20)
+    except (OSError, ValueError):
+        import resource
+        return(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024)
+
+
+def metric(value: float, unit: str, better: str, slack: float = 0.) -> dict:
+    """Result of a benchmark, compared with the baseline up to a relative tolerance, or an absolute slack
+
+    :param better: "lower" or "higher", None for an informational value which is never compared
+    """
+    return {"value": value, "unit": unit, "better": better, "slack": slack}
+
+
+def bench_solve(dice: list, repeat: int) -> dict:
+    """Build time of the turn graph and solve time of Player.expectancy(0, N, 0) with an empty store (best of repeat)"""
+    res = {}
+    for N in dice:
+        def build():
+            turn_graph.cache_clear()
+            turn_graph(N)
+        res[f"graph_{N}_dice"] = metric(measure(build, repeat)["best"], "s", "lower")
+
+        def solve():
+            STORE.clear()
+            player = PlayerAB(N_dice=N)
+            player.expectancy(0, N, 0)
+        res[f"solve_{N}_dice"] = metric(measure(solve, repeat)["best"], "s", "lower")
+    STORE.clear()
+    return res
+
+
+def bench_games(n_games: int, seed: int) -> dict:
+    """Games per second of Game.play_game between two PlayerAB, and of BatchGame"""
+    from batch import BatchGame
+
+    game = Game(PlayerAB(), PlayerAB(), dice=DiceSource(seed))
+    game.reinit()
+    game.play_game(display=False)# warm up the store
+    tic = time.perf_counter()
+    for _ in range(n_games):
+        game.reinit()
+        game.play_game(display=False)
+    res = {"game_games_per_s": metric(n_games/(time.perf_counter() - tic), "games/s", "higher")}
+
+    batch = BatchGame(10*n_games, dice=DiceSource(seed))
+    batch.play_game()
+    batch.reinit()
+    tic = time.perf_counter()
+    batch.play_game()
+    res["batch_games_per_s"] = metric(batch.n_games/(time.perf_counter() - tic), "games/s", "higher")
+    return res
+
+
+def bench_agent(repeat: int) -> dict:
+    """Latency of a step of the agent: grid search of (alpha, beta) from a position of the game"""
+    try:
+        from agent import Agent, Actor, GRID
+    except ImportError as error:
+        return {"skipped": str(error)}
+    agent = Agent(Actor())
+    agent.game.reinit()
+    agent.grid_search(GRID, GRID)# warm up the store
+    return {"grid_search_step": metric(measure(lambda: agent.grid_search(GRID, GRID), repeat)["best"], "s", "lower")}
+
+
+def bench_memory(n_epochs: int, n_players: int, n_games: int, seed: int) -> dict:
+    """Memory growth over an evolution run like genetique.py: random (alpha, beta) evaluated at each epoch"""
+    from tournament import PlayerConfig, run_tournament
+
+    rng = np.random.default_rng(seed)
+    rules = dict(N_dice=4, domino_min=11, domino_max=18, r=[1, 1, 2, 2, 3, 3, 4, 4])
+    opponent = PlayerConfig(PlayerAB, 1, 1, **rules)
+    STORE.clear()
+    gc.collect()
+    start = rss()
+    tic = time.perf_counter()
+    for epoch in range(n_epochs):
+        configs = [PlayerConfig(PlayerAB, *rng.uniform(0, 2, 2), **rules) for _ in range(n_players)]
+        run_tournament(configs, opponent, n_games, max_workers=0, seed=epoch)
+    duration = time.perf_counter() - tic
+    gc.collect()
+    res = {
+        "evolution_epoch": metric(duration/n_epochs, "s", "lower"),
+        "evolution_rss_growth": metric(rss() - start, "MB", "lower", slack=2.),
+        # Informational: the number of tables stored is capped by the size of the store
+        "evolution_tables": metric(len(STORE), "tables", None),
+    }
+    STORE.clear()
+    return res
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def sizes(quick: bool = False) -> dict:
+    """Sizes of the benchmarks, smaller for a smoke test"""
+    if quick:
+        return {"dice": [2, 4, 6, 8], "solve_repeat": 3, "games": 20, "agent_repeat": 3, "epochs": 3, "players": 5, "epoch_games": 20}
+    return {"dice": [2, 4, 6, 8, 10], "solve_repeat": 10, "games": 200, "agent_repeat": 20, "epochs": 20, "players": 5, "epoch_games": 50}
+
+
+def run(quick: bool = False, seed: int = 0) -> dict:
+    """Runs the whole suite
+
+    :param quick: smaller sizes, for a smoke test
+    :type quick: bool
+    :return: metadata (with the mode, the sizes and the seed) and results of each benchmark
+    :rtype: dict
+    """
+    # Tables are always solved, never read from the disk cache
+    STORE.set_cache(None)
+    size = sizes(quick)
+    results = {}
+    results["solve"] = bench_solve(size["dice"], size["solve_repeat"])
+    results["games"] = bench_games(size["games"], seed)
+    results["agent"] = bench_agent(size["agent_repeat"])
+    results["memory"] = bench_memory(size["epochs"], size["players"], size["epoch_games"], seed)
+    meta = metadata()
+    meta.update(quick=quick, sizes=size, seed=seed)
+    return {"meta": meta, "results": results}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """Compares the results with a baseline run with the same mode, sizes and seed
+
+    :param tolerance: relative change under which a metric is considered unchanged
+    :type tolerance: float
+    :raises ValueError: if the baseline was run with other sizes (or does not record them)
+    :return: (benchmark, metric, baseline value, value, ratio, status) for each metric found in both, the status
+        of the informational metrics being "info"
+    :rtype: list
+    """
+    for key in ("quick", "sizes", "seed"):
+        if results["meta"].get(key) != baseline["meta"].get(key):
+            raise ValueError(f"the baseline was run with {key} {baseline['meta'].get(key)}, not {results['meta'].get(key)}")
+    rows = []
+    for bench, metrics in results["results"].items():
+        for name, current in metrics.items():
+            reference = baseline["results"].get(bench, {}).get(name)
+            if not isinstance(current, dict) or not isinstance(reference, dict):
+                continue
+            ratio = current["value"]/reference["value"] if reference["value"] else float("inf")
+            gain = ratio if current["better"] == "higher" else 1/ratio if ratio else float("inf")
+            within_slack = abs(current["value"] - reference["value"]) <= current.get("slack", 0.)
+            if current["better"] is None:
+                rows.append((bench, name, reference["value"], current["value"], ratio, "info"))
+                continue
+            status = "ok" if within_slack or abs(gain - 1) <= tolerance else ("better" if gain > 1 else "REGRESSION")
+            rows.append((bench, name, reference["value"], current["value"], ratio, status))
+    return rows
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="bench.json", help="JSON file of the results")
+    parser.add_argument("--baseline", help="JSON file of results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change reported as a regression or a win")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a smoke test")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = run(args.quick, args.seed)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    for bench, metrics in results["results"].items():
+        for name, value in metrics.items():
+            print(f"{bench:8}{name:26}" + (f"{value['value']:12.6g} {value['unit']}" if isinstance(value, dict) else str(value)))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        print(f"\ncomparison with {args.baseline} ({baseline['meta'].get('commit', '')})")
+        try:
+            rows = compare(results, baseline, args.tolerance)
+        except ValueError as error:
+            sys.exit(f"cannot compare: {error}")
+        for bench, name, reference, value, ratio, status in rows:
+            print(f"{bench:8}{name:26}{reference:12.6g}{value:12.6g}{ratio:8.2f}x  {status}")
+        if any(row[-1] == "REGRESSION" for row in rows):
+            sys.exit(1)
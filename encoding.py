@@ -0,0 +1,66 @@
+import numpy as np
+
+# Layout of an encoded state: availability of the dominos of the grill, then the stack of the player and the stack
+# of the adversary, bottom first and padded with 0
+N_SLOTS = 16
+GRILL = slice(0, N_SLOTS)
+ME = slice(N_SLOTS, 2*N_SLOTS)
+ADV = slice(2*N_SLOTS, 3*N_SLOTS)
+STATE_SIZE = 3*N_SLOTS
+
+
+def encode_state(row: np.ndarray, grill: list, me: list, adv: list) -> np.ndarray:
+    """Encodes a state given as in Game in a row of STATE_SIZE floats, written in place
+
+    :param row: destination, shape (STATE_SIZE,)
+    :type row: np.ndarray
+    :param grill: available dominos
+    :type grill: list[bool]
+    :param me: stack of the player, top last
+    :type me: list[int]
+    :param adv: stack of the adversary, top last
+    :type adv: list[int]
+    :return: row
+    :rtype: np.ndarray
+    """
+    row[:] = 0
+    row[GRILL.start:GRILL.start + len(grill)] = grill
+    row[ME.start:ME.start + len(me)] = me
+    row[ADV.start:ADV.start + len(adv)] = adv
+    return(row)
+
+
+def encode_states(array: np.ndarray, grill: np.ndarray, me: np.ndarray, adv: np.ndarray) -> np.ndarray:
+    """Encodes a batch of states given as arrays, the stacks being padded with 0, in the first rows of array
+
+    :param array: destination, shape (at least N, STATE_SIZE)
+    :type array: np.ndarray
+    :param grill: available dominos, shape (N, N_SLOTS)
+    :type grill: np.ndarray
+    :param me: stacks of the player, shape (N, N_SLOTS)
+    :type me: np.ndarray
+    :param adv: stacks of the adversary, shape (N, N_SLOTS)
+    :type adv: np.ndarray
+    :return: the N rows written
+    :rtype: np.ndarray
+    """
+    n = len(grill)
+    array[:n, GRILL] = grill
+    array[:n, ME] = me
+    array[:n, ADV] = adv
+    return(array[:n])
+
+
+def decode_states(array: np.ndarray) -> tuple:
+    """Decodes a batch of encoded states
+
+    :param array: states of shape (N, STATE_SIZE)
+    :type array: np.ndarray
+    :return: (grill (N, N_SLOTS) bool, stacks of me (N, N_SLOTS), stacks of adv (N, N_SLOTS), heights of the stacks (N, 2)), stacks padded with 0
+    :rtype: tuple
+    """
+    grill = array[:, GRILL] > 0
+    me = array[:, ME].astype(np.int64)
+    adv = array[:, ADV].astype(np.int64)
+    heights = np.column_stack(((me > 0).sum(axis=1), (adv > 0).sum(axis=1)))
+    return grill, me, adv, heights
@@ -0,0 +1,227 @@
+import multiprocessing
+import queue
+import numpy as np
+from players import PlayerAB
+from tables import STORE
+from tournament import PlayerConfig, play_games
+
+PERCENTILES = [10, 30, 50, 70, 90]
+
+
+class Island:
+    """Population of PlayerAB parameters (alpha, beta) evolved in steady state.
+
+    At each step a parent is chosen by tournament selection, mutated by a uniform step, evaluated and put in
+    place of a random individual outside of the elite, so there are no generations to wait for. Every
+    individual is evaluated with the same games (common random numbers), so the fitness is a function of the
+    parameters: parameters are rounded and fitnesses are cached. Every migration_interval evaluations, the best
+    individuals are sent to the next island and the individuals received replace random non-elite individuals.
+
+    :param opponent: opponent of the evaluations
+    :type opponent: PlayerConfig
+    :param size: size of the population
+    :type size: int
+    :param elite: number of best individuals never replaced
+    :type elite: int
+    :param n_games: number of games of an evaluation
+    :type n_games: int
+    :param init_range: range of the random initial parameters
+    :type init_range: tuple
+    :param bounds: range of the parameters
+    :type bounds: tuple
+    :param mutation: maximal step of a mutation
+    :type mutation: float
+    :param tournament_size: number of individuals compared to choose a parent
+    :type tournament_size: int
+    :param migration_interval: number of evaluations between two migrations
+    :type migration_interval: int
+    :param n_migrants: number of individuals sent at each migration
+    :type n_migrants: int
+    :param precision: number of decimals of the parameters
+    :type precision: int
+    :param inbox: queue of the individuals received
+    :param outbox: queue of the individuals sent
+    :param seed: seed of the evolution
+    :param eval_seed: seed of the games of the evaluations
+    :type eval_seed: int
+    """
+
+    def __init__(self, opponent: PlayerConfig, size: int = 10, elite: int = 2, n_games: int = 50, init_range: tuple = (0, 2), bounds: tuple = (0, 20), mutation: float = 0.2, tournament_size: int = 2, migration_interval: int = 20, n_migrants: int = 1, precision: int = 3, inbox=None, outbox=None, seed=None, eval_seed: int = 0) -> None:
+        self.opponent = opponent
+        self.size = size
+        self.elite = elite
+        self.n_games = n_games
+        self.init_range = init_range
+        self.bounds = bounds
+        self.mutation = mutation
+        self.tournament_size = tournament_size
+        self.migration_interval = migration_interval
+        self.n_migrants = n_migrants
+        self.precision = precision
+        self.inbox = inbox
+        self.outbox = outbox
+        self.rng = np.random.default_rng(seed)
+        self.eval_seed = eval_seed
+        self.population = [] # (fitness, (alpha, beta)), best first
+        self.cache = {}
+        self.evaluations = 0
+        self.cache_hits = 0
+        self.history = []
+
+    def evaluate(self, params: tuple) -> float:
+        """Mean score difference of PlayerAB(alpha, beta) against the opponent, cached by parameters"""
+        if params in self.cache:
+            self.cache_hits += 1
+            return self.cache[params]
+        config = PlayerConfig(PlayerAB, params[0], params[1], self.opponent.N_dice, self.opponent.domino_min, self.opponent.domino_max, self.opponent.r)
+        fitness = float(play_games(config, self.opponent, self.n_games, np.random.SeedSequence(self.eval_seed)).mean())
+        self.cache[params] = fitness
+        return fitness
+
+    def select(self) -> tuple:
+        """Tournament selection of a parent"""
+        contestants = self.rng.integers(len(self.population), size=self.tournament_size)
+        return self.population[contestants.min()][1]
+
+    def mutate(self, params: tuple) -> tuple:
+        step = self.rng.uniform(-self.mutation, self.mutation, 2)
+        return tuple(np.round(np.clip(np.asarray(params) + step, *self.bounds), self.precision).tolist())
+
+    def insert(self, fitness: float, params: tuple) -> None:
+        """Adds an individual, in place of a random non-elite individual if the population is full"""
+        if len(self.population) >= self.size:
+            self.population.pop(self.rng.integers(min(self.elite, len(self.population) - 1), len(self.population)))
+        self.population.append((fitness, params))
+        self.population.sort(key=lambda individual: -individual[0])
+
+    def migrate(self) -> None:
+        if self.outbox is not None:
+            self.outbox.put(self.population[:self.n_migrants])
+        if self.inbox is not None:
+            while True:
+                try:
+                    migrants = self.inbox.get_nowait()
+                except queue.Empty:
+                    break
+                for fitness, params in migrants:
+                    self.cache.setdefault(params, fitness)
+                    self.insert(fitness, params)
+
+    def step(self) -> None:
+        """Evaluates a new individual: random while the population is not full, a mutated parent afterwards"""
+        if len(self.population) < self.size:
+            params = tuple(np.round(self.rng.uniform(*self.init_range, 2), self.precision).tolist())
+        else:
+            params = self.mutate(self.select())
+        self.insert(self.evaluate(params), params)
+        self.evaluations += 1
+        if self.evaluations % self.migration_interval == 0:
+            self.migrate()
+        if self.evaluations % self.size == 0:
+            self.history.append(np.array([fitness for fitness, _ in self.population]))
+
+    def result(self) -> dict:
+        """Returns the population, history, evaluations, cache_hits and the counters of the strategy tables of the
+        process (shared by all the islands when they are not run in their own processes)"""
+        return {"population": self.population, "history": self.history, "evaluations": self.evaluations, "cache_hits": self.cache_hits,
+                "tables": STORE.stats()}
+
+
+def _run_island(island: Island, n_evaluations: int, results: multiprocessing.Queue, index: int) -> None:
+    # The migrants left in the queues when an island stops are dropped instead of blocking its exit
+    island.outbox.cancel_join_thread()
+    for _ in range(n_evaluations):
+        island.step()
+    results.put((index, island.result()))
+
+
+class Evolution:
+    """Island model evolution of the parameters (alpha, beta) of PlayerAB against a fixed opponent.
+
+    Each island evolves in steady state (see Island) in its own process, with no synchronization between the
+    islands: a process is never idle waiting for the evaluations of the others. The islands form a ring, each
+    one sending its best individuals to the next one every migration_interval evaluations.
+
+    :param opponent: opponent of the evaluations
+    :type opponent: PlayerConfig
+    :param n_islands: number of islands
+    :type n_islands: int
+    :param processes: run each island in its own process, else the islands are stepped in turn in this process
+    :type processes: bool
+    :param seed: seed of the evolution
+    :type seed: int
+    :param island_params: parameters of the islands (size, elite, n_games, mutation, migration_interval, ...)
+    """
+
+    def __init__(self, opponent: PlayerConfig, n_islands: int = 4, processes: bool = True, seed: int = 0, **island_params) -> None:
+        self.opponent = opponent
+        self.n_islands = n_islands
+        self.processes = processes
+        self.seed = seed
+        self.island_params = island_params
+        self.results = []
+
+    def run(self, n_evaluations: int) -> list:
+        """Evolves the islands
+
+        :param n_evaluations: number of evaluations per island
+        :type n_evaluations: int
+        :return: results of the islands: population (fitness, (alpha, beta)) best first, history, evaluations, cache_hits and tables
+        :rtype: list[dict]
+        """
+        seeds = np.random.SeedSequence(self.seed).spawn(self.n_islands)
+        if self.processes:
+            context = multiprocessing.get_context()
+            queues = [context.Queue() for _ in range(self.n_islands)]
+        else:
+            queues = [queue.Queue() for _ in range(self.n_islands)]
+        islands = [Island(self.opponent, inbox=queues[i], outbox=queues[(i + 1) % self.n_islands], seed=seeds[i],
+                          eval_seed=self.seed, **self.island_params) for i in range(self.n_islands)]
+        if self.processes:
+            results = context.Queue()
+            workers = [context.Process(target=_run_island, args=(island, n_evaluations, results, i)) for i, island in enumerate(islands)]
+            for worker in workers:
+                worker.start()
+            self.results = [None]*self.n_islands
+            for _ in workers:
+                index, result = results.get()
+                self.results[index] = result
+            for worker in workers:
+                worker.join()
+        else:
+            for _ in range(n_evaluations):
+                for island in islands:
+                    island.step()
+            self.results = [island.result() for island in islands]
+        return self.results
+
+    def best(self) -> tuple:
+        """Returns the best individual of all the islands, (fitness, (alpha, beta))"""
+        return max((result["population"][0] for result in self.results), key=lambda individual: individual[0])
+
+    def history(self, percentiles: list = PERCENTILES) -> np.ndarray:
+        """Percentiles of the fitness of all the islands, every population size evaluations
+
+        :return: min, percentiles and max of each period, shape (n_periods, len(percentiles) + 2)
+        :rtype: np.ndarray
+        """
+        n_periods = min(len(result["history"]) for result in self.results)
+        rows = []
+        for period in range(n_periods):
+            fitness = np.concatenate([result["history"][period] for result in self.results])
+            rows.append([fitness.min()] + [np.percentile(fitness, percent) for percent in percentiles] + [fitness.max()])
+        return np.array(rows).reshape(n_periods, len(percentiles) + 2)
+
+
+if __name__ == "__main__":
+
+    import time
+
+    rules = dict(N_dice=4, domino_min=11, domino_max=18, r=[1, 1, 2, 2, 3, 3, 4, 4])
+    evolution = Evolution(PlayerConfig(PlayerAB, 1, 1, **rules), n_islands=2, size=8, n_games=100)
+    tic = time.time()
+    results = evolution.run(40)
+    print(f"{sum(result['evaluations'] for result in results)} evaluations in {time.time() - tic:.1f}s, "
+          f"{sum(result['cache_hits'] for result in results)} cache hits")
+    print("best (fitness, (alpha, beta)):", evolution.best())
+    print(evolution.history())
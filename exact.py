@@ -0,0 +1,331 @@
+import functools
+import itertools
+import os
+from math import perm
+from tools import *
+from tables import solve_batch, turn_graph
+from players import Player
+from tracing import TRACER, TURN
+
+MAX_EXACT_DOMINOS = 8
+
+# PERMS[n, k] = n!/(n-k)!, the number of arrangements of k elements among n
+PERMS = np.array([[perm(n, k) for k in range(MAX_EXACT_DOMINOS + 1)] for n in range(MAX_EXACT_DOMINOS + 1)], dtype=np.int64)
+
+
+class PositionIndex:
+    """Dense index of the positions of a game with n_dominos dominos.
+
+    A position is seen by the player to move: (grill, stack of the player, stack of the adversary), the
+    dominos being numbered from 0 (domino_min). The dominos which are not on the grill are either in one
+    of the stacks or flipped, so for a grill with k dominos out, the positions are ranked by the heights
+    (a, b) of the stacks, then by the rank of the stack of the player among the arrangements of a of the k
+    dominos, then by the rank of the stack of the adversary among the arrangements of b of the k-a others.
+    The grills are ordered by their bit mask.
+
+    :param n_dominos: number of dominos, at most MAX_EXACT_DOMINOS
+    :type n_dominos: int
+    """
+
+    def __init__(self, n_dominos: int) -> None:
+        if n_dominos > MAX_EXACT_DOMINOS:
+            raise ValueError(f"the exact solver handles at most {MAX_EXACT_DOMINOS} dominos")
+        self.n_dominos = n_dominos
+        self.full = (1 << n_dominos) - 1
+        # blocks[k, a, b]: offset of the positions with stacks of heights (a, b) among the positions with k dominos out
+        self.blocks = np.zeros((n_dominos + 1, n_dominos + 1, n_dominos + 1), dtype=np.int64)
+        self.counts = np.zeros(n_dominos + 1, dtype=np.int64)
+        for k in range(n_dominos + 1):
+            offset = 0
+            for a in range(k + 1):
+                for b in range(k - a + 1):
+                    self.blocks[k, a, b] = offset
+                    offset += PERMS[k, a]*PERMS[k - a, b]
+            self.counts[k] = offset
+        grills = np.arange(1 << n_dominos)
+        self.outs = n_dominos - np.bitwise_count(grills).astype(np.int64)
+        self.bases = np.concatenate(([0], np.cumsum(self.counts[self.outs])))
+        self.size = int(self.bases[-1])
+
+    def rank(self, grill: int, me: list, adv: list) -> int:
+        """Returns the index of a position, the stacks being lists of domino numbers (bottom first)"""
+        out = self.full & ~grill
+        k = self.n_dominos - bin(grill).count("1")
+        a, b = len(me), len(adv)
+        res = self.bases[grill] + self.blocks[k, a, b]
+        rank_me, out = self._arrangement_rank(me, out, k)
+        rank_adv, _ = self._arrangement_rank(adv, out, k - a)
+        return(int(res + rank_me*PERMS[k - a, b] + rank_adv))
+
+    @staticmethod
+    def _arrangement_rank(seq: list, elements: int, m: int):
+        rank = 0
+        for i, x in enumerate(seq):
+            rank += bin(elements & ((1 << x) - 1)).count("1")*PERMS[m - 1 - i, len(seq) - 1 - i]
+            elements &= ~(1 << x)
+        return(rank, elements)
+
+    def rank_batch(self, grills: np.ndarray, me: np.ndarray, a: np.ndarray, adv: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """Vectorized rank, the stacks being given as arrays (K, L) padded with any domino and their heights
+
+        :return: index of each position, shape (K,)
+        :rtype: np.ndarray
+        """
+        grills = np.broadcast_to(grills, a.shape)
+        out = self.full & ~grills
+        k = self.outs[grills]
+        rank_me, out = self._arrangement_rank_batch(me, a, out, k)
+        rank_adv, _ = self._arrangement_rank_batch(adv, b, out, k - a)
+        return(self.bases[grills] + self.blocks[k, a, b] + rank_me*PERMS[k - a, b] + rank_adv)
+
+    @staticmethod
+    def _arrangement_rank_batch(seq: np.ndarray, lengths: np.ndarray, elements: np.ndarray, m: np.ndarray):
+        rank = np.zeros(len(lengths), dtype=np.int64)
+        for i in range(seq.shape[1]):
+            valid = i < lengths
+            bit = np.where(valid, np.left_shift(1, seq[:, i]), 0)
+            smaller = np.bitwise_count(elements & (bit - 1)).astype(np.int64)
+            rank += np.where(valid, smaller*PERMS[np.maximum(m - 1 - i, 0), np.maximum(lengths - 1 - i, 0)], 0)
+            elements = elements & ~bit
+        return(rank, elements)
+
+    @functools.cache
+    def template(self, k: int):
+        """Lists the positions of a grill with k dominos out in index order, the dominos out being numbered 0 to k-1
+
+        :return: (me, a, adv, b), stacks of shape (count, n_dominos + 1) padded with 0 and their heights
+        :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        """
+        me, adv, a, b = [], [], [], []
+        for len_me in range(k + 1):
+            for len_adv in range(k - len_me + 1):
+                for stack_me in itertools.permutations(range(k), len_me):
+                    others = [x for x in range(k) if x not in stack_me]
+                    for stack_adv in itertools.permutations(others, len_adv):
+                        me.append(stack_me + (0,)*(self.n_dominos + 1 - len_me))
+                        adv.append(stack_adv + (0,)*(self.n_dominos + 1 - len_adv))
+                        a.append(len_me)
+                        b.append(len_adv)
+        shape = (len(a), self.n_dominos + 1)
+        return(np.array(me, dtype=np.int64).reshape(shape), np.array(a, dtype=np.int64),
+               np.array(adv, dtype=np.int64).reshape(shape), np.array(b, dtype=np.int64))
+
+
+class ExactSolution:
+    """Values of all the positions of a ruleset under optimal play of both players.
+
+    The value of a position is the expected difference between the points the player to move will win and
+    the points the adversary will win until the end of the game. The values are stored in a .npy file opened
+    as a memory map, so a lookup only reads the page of the position.
+
+    :param path: path of the file written by solve_game
+    :type path: str
+    """
+
+    def __init__(self, path: str, N_dice: int, domino_min: int, domino_max: int, r: list) -> None:
+        self.N_dice = N_dice
+        self.domino_min = domino_min
+        self.domino_max = domino_max
+        self.r = list(r)
+        self.index = PositionIndex(domino_max - domino_min + 1)
+        self.values = np.load(path, mmap_mode="r")
+
+    def grill2mask(self, grill: list) -> int:
+        return(sum(1 << i for i, available in enumerate(grill) if available))
+
+    def value(self, grill: list, me: list, adv: list) -> float:
+        """Returns the value of a position given as in Game (grill, dominos of the player to move, of the adversary)"""
+        return(float(self.values[self.index.rank(self.grill2mask(grill), [d - self.domino_min for d in me], [d - self.domino_min for d in adv])]))
+
+    def turn_rewards(self, grill: list, me: list, adv: list):
+        """Computes the terminal rewards of the turn of the player to move, including the value of the position reached
+
+        :return: (reward of a failed turn, reward of stopping with each score, domino selected with each score (-1 to lose the turn))
+        :rtype: Tuple[float, tuple, list]
+        """
+        grill = self.grill2mask(grill)
+        me = [d - self.domino_min for d in me]
+        adv = [d - self.domino_min for d in adv]
+        n = self.index.n_dominos
+
+        # Losing the turn: the top domino is lost and the highest domino of the grill is flipped
+        lost = self.r[me[-1]] if me else 0
+        lose = -lost - float(self.values[self.index.rank(grill & ~(1 << (grill.bit_length() - 1)), adv, me[:-1])])
+        stop_rewards = [lose]*(5*self.N_dice + 1)
+        actions = [-1]*(5*self.N_dice + 1)
+        best, best_domino = lose, -1
+        for d in range(n):
+            if (grill >> d) & 1:
+                take = self.r[d] - float(self.values[self.index.rank(grill & ~(1 << d), adv, me + [d])])
+                if take > best:
+                    best, best_domino = take, d + self.domino_min
+            score = d + self.domino_min
+            stop_rewards[score], actions[score] = best, best_domino
+        for score in range(self.domino_max + 1, 5*self.N_dice + 1):
+            stop_rewards[score], actions[score] = best, best_domino
+        if adv:
+            steal = 2*self.r[adv[-1]] - float(self.values[self.index.rank(grill, adv[:-1], me + [adv[-1]])])
+            score = adv[-1] + self.domino_min
+            if steal >= stop_rewards[score]:
+                stop_rewards[score], actions[score] = steal, score
+        return(lose, tuple(stop_rewards), actions)
+
+
+def solve_game(N_dice: int, domino_min: int, domino_max: int, r: list, path: str, tol: float = 1e-10, verbose: bool = False) -> ExactSolution:
+    """Computes the value of every position of a ruleset under optimal play and stores them in a .npy file.
+
+    The positions are solved by increasing number of dominos on the grill, since taking a domino or losing
+    the turn removes a domino from the grill. For each position, the options at the end of the turn (steal,
+    take any available domino up to the score, lose the turn) give the terminal rewards of the turn, whose
+    Bellman equation is solved by solve_batch for all the positions of a grill at once. Stealing keeps the
+    grill: a position and the one reached by stealing depend on each other, their values are found by fixed
+    point iterations.
+
+    :param path: path of the .npy file written
+    :type path: str
+    :param tol: tolerance of the fixed point iterations
+    :type tol: float
+    :return: the solution, read from the file
+    :rtype: ExactSolution
+    """
+    n = domino_max - domino_min + 1
+    if domino_max > 5*N_dice:
+        raise ValueError("the dominos must be reachable with the dice")
+    index = PositionIndex(n)
+    r = np.asarray(r, dtype=np.float64)
+    start = turn_graph(N_dice).compact_start
+    values = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(index.size,))
+    values[:] = 0
+
+    def turn_values(fail_rewards, stop_rewards):
+        return(solve_batch(N_dice, fail_rewards, stop_rewards)[:, start])
+
+    scores = np.arange(5*N_dice + 1)
+    dominos = np.arange(n)
+    for grill in sorted(range(1, 1 << n), key=lambda g: bin(g).count("1")):
+        k = index.outs[grill]
+        out = np.flatnonzero([not (grill >> d) & 1 for d in range(n)])
+        me, a, adv, b = index.template(k)
+        me, adv = out[me] if k else me, out[adv] if k else adv
+        rows = np.arange(len(a))
+        first = index.bases[grill]
+
+        highest = grill.bit_length() - 1
+        lost = np.where(a > 0, r[me[rows, np.maximum(a - 1, 0)]], 0.)
+        lose = -lost - values[index.rank_batch(grill & ~(1 << highest), adv, b, me, np.maximum(a - 1, 0))]
+
+        takes = np.full((len(a), n), -np.inf)
+        for d in dominos[(grill >> dominos) & 1 == 1]:
+            pushed = me.copy()
+            pushed[rows, a] = d
+            takes[:, d] = r[d] - values[index.rank_batch(grill & ~(1 << d), adv, b, pushed, a + 1)]
+        takes = np.maximum.accumulate(takes, axis=1)
+        stop_rewards = np.where(scores < domino_min, lose[:, None], np.maximum(lose[:, None], takes[:, np.clip(scores - domino_min, 0, n - 1)]))
+
+        values[first:first + len(a)] = turn_values(lose, stop_rewards)
+
+        stealing = np.flatnonzero(b > 0)
+        if not len(stealing):
+            continue
+        stolen = adv[stealing, b[stealing] - 1]
+        pushed = me[stealing].copy()
+        pushed[np.arange(len(stealing)), a[stealing]] = stolen
+        partners = index.rank_batch(grill, adv[stealing], b[stealing] - 1, pushed, a[stealing] + 1)
+        stop_rewards = stop_rewards[stealing]
+        columns = stolen + domino_min
+        base = stop_rewards[np.arange(len(stealing)), columns]
+        # Position of the partner of each stealing position in the stealing positions
+        local = np.full(len(a), -1)
+        local[stealing] = np.arange(len(stealing))
+        partners_local = local[partners - first]
+        # Gauss-Seidel iterations: the positions are solved in two groups, each position and its partner being
+        # in different groups (or the same position), and only the positions which moved or whose partner
+        # moved are solved again
+        groups = (np.flatnonzero(partners_local >= np.arange(len(stealing))), np.flatnonzero(partners_local < np.arange(len(stealing))))
+        active = np.ones(len(stealing), dtype=bool)
+        for iteration in itertools.count(1):
+            moved = np.zeros(len(stealing), dtype=bool)
+            for group in groups:
+                solved = group[active[group]]
+                stop_rewards[solved, columns[solved]] = np.maximum(base[solved], 2*r[stolen[solved]] - values[partners[solved]])
+                new_values = turn_values(lose[stealing[solved]], stop_rewards[solved])
+                moved[solved] = np.abs(new_values - values[first + stealing[solved]]) >= tol
+                values[first + stealing[solved]] = new_values
+            active = moved | moved[partners_local]
+            if not active.any():
+                break
+        if verbose:
+            print(f"grill {grill:0{n}b}: {len(a)} positions, {iteration} iterations of the steals")
+    values.flush()
+    del values
+    return(ExactSolution(path, N_dice, domino_min, domino_max, r))
+
+
+def solution_path(N_dice: int, domino_min: int, domino_max: int, r: list) -> str:
+    return(f"exact_{N_dice}_{domino_min}_{domino_max}_{'-'.join(str(x) for x in r)}.npy")
+
+
+@functools.cache
+def _exact_solution(N_dice: int, domino_min: int, domino_max: int, r: tuple, path: str) -> ExactSolution:
+    if not os.path.exists(path):
+        return(solve_game(N_dice, domino_min, domino_max, r, path))
+    return(ExactSolution(path, N_dice, domino_min, domino_max, r))
+
+
+def exact_solution(N_dice: int = 4, domino_min: int = 11, domino_max: int = 18, r: list = [1, 1, 2, 2, 3, 3, 4, 4], path: str = None) -> ExactSolution:
+    """Returns the exact solution of a ruleset, solving it the first time and reading it from its file afterwards
+
+    :param path: path of the file, defaults to exact_{N_dice}_{domino_min}_{domino_max}_{r}.npy
+    :type path: str, optional
+    """
+    if path is None:
+        path = solution_path(N_dice, domino_min, domino_max, r)
+    return(_exact_solution(N_dice, domino_min, domino_max, tuple(r), path))
+
+
+class ExactPlayer(Player):
+    """Optimal player of a small ruleset.
+
+    At the beginning of each turn, the terminal rewards of the turn are the exact values of the positions
+    reached, so the strategy tables give the optimal play of the turn and of the game.
+    """
+
+    def __init__(self, N_dice = 4, domino_min = 11, domino_max = 18, r = [1, 1, 2, 2, 3, 3, 4, 4]) -> None:
+        super().__init__(N_dice, domino_min, domino_max, r)
+        self.solution = exact_solution(N_dice, domino_min, domino_max, r)
+        self.stop_rewards = None
+        self.actions = None
+        self.failed = False
+
+    def init_turn(self, grill: list[bool], r: list[int], dominos_adv: list[int]):
+        fail_reward, self.stop_rewards, self.actions = self.solution.turn_rewards(grill, self.dominos, dominos_adv)
+        self.table = None
+        self.C = -fail_reward
+        if TRACER.enabled:
+            TRACER.emit(TURN, self.C)
+
+    def rewardfun(self, score : int, previous_choices : int) -> int:
+        if previous_choices % 2 == 1:
+            return(self.stop_rewards[score])
+        return(-self.C)
+
+    def play_dice(self, dice_results : tuple, previous_choices : int, nb_available_dice : int, score : int) -> int:
+        choice = super().play_dice(dice_results, previous_choices, nb_available_dice, score)
+        self.failed = choice is None
+        return(choice)
+
+    def play_grill(self, grill, score : int) -> int:
+        # When the turn is failed, the score given by Game is the reward of a failed turn
+        if self.failed:
+            return(-1)
+        return(self.actions[score])
+
+
+if __name__ == "__main__":
+
+    import time
+
+    tic = time.time()
+    solution = solve_game(4, 11, 18, [1, 1, 2, 2, 3, 3, 4, 4], solution_path(4, 11, 18, [1, 1, 2, 2, 3, 3, 4, 4]), verbose=True)
+    print(f"{solution.index.size} positions solved in {time.time() - tic:.1f}s")
+    print(f"value of the first player: {solution.value([True]*8, [], []):.4f}")
@@ -1,12 +1,15 @@
-import logging
 import os
+import time
 
 from tools import *
 from players import *
+from tracing import *
+from state import GameState
+from profiling import PROFILER
 
 class Game:
 
-    def __init__(self, playerA : Player, playerB : Player, N_dice = 8, domino_min = 21, domino_max = 36, r = [1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4]) -> None:
+    def __init__(self, playerA : Player, playerB : Player, N_dice = 8, domino_min = 21, domino_max = 36, r = [1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4], dice: DiceSource = None) -> None:
         self.domino_min = domino_min
         self.domino_max = domino_max
         self.grill = (self.domino_max-self.domino_min+1)
@@ -14,6 +17,7 @@ class Game:
         self.playerB = playerB
         self.N_dice = N_dice
         self.r = r
+        self.dice = dice if dice is not None else DiceSource()
 
     def reinit(self):
         self.grill = [True]* (self.domino_max-self.domino_min+1)
@@ -35,7 +39,15 @@ class Game:
         return res
 
     def over(self) -> bool:
-        return(not np.any(self.grill))
+        return(not any(self.grill))
+
+    def snapshot(self) -> GameState:
+        """Returns the compact state of the game (grill and stacks of both players)"""
+        return(GameState.from_game(self))
+
+    def restore(self, state: GameState) -> None:
+        """Puts the game and its players back in the given state"""
+        state.to_game(self)
     
             
     def play_dice_part(self, player : Player) -> int:
@@ -44,14 +56,17 @@ class Game:
         previous_choices = 0
         for i in range(8): # At each turn, the number of dice is decreased by at least one (or the round is stopped). Thus we do at most 8 turns.
             # Draw the dice
-            dice_results = draw_dice(nb_available_dice)
-            logging.info(f"dice: {dice_results}")
+            dice_results = self.dice.draw(nb_available_dice)
+            if PROFILER.enabled:
+                PROFILER.count("throws")
+            if TRACER.enabled:
+                TRACER.emit(DICE, *dice_results)
             # Send the result to the play and let them chose what to do
             player_choice = player.play_dice(dice_results, previous_choices, nb_available_dice, score)
-            logging.info(f" player's choice: {player_choice}")
             
             if player_choice is None:# The Player can't choose, the round is failed
-                logging.info(f" player fails, reward = {-player.C}")
+                if TRACER.enabled:
+                    TRACER.emit(FAIL, -player.C)
                 return(-player.C)
             else:
                 score += (player_choice[0] if player_choice[0] else 5)*dice_results[player_choice[0]]
@@ -60,30 +75,45 @@ class Game:
                     nb_available_dice -= dice_results[player_choice[0]]
                     continue
                 else:# player decides to stop
-                    logging.info(f" player stops, reward = {score}")
+                    if TRACER.enabled:
+                        TRACER.emit(STOP, score)
                     return(score)
     
     
     def play_grill_part(self, player : Player, score : int) -> int:
-        logging.info(f"state: {self}")
+        if TRACER.enabled:
+            TRACER.emit(STATE, sum(1 << i for i, available in enumerate(self.grill) if available), len(self.grill),
+                        self.playerA.dominos[-1] if self.playerA.dominos else 0, self.playerB.dominos[-1] if self.playerB.dominos else 0)
         player_selection = player.play_grill(self.grill, score)
         return(player_selection)
     
     def play_turn(self, playing_player: Player, waiting_player:Player) -> int:
         playing_player.init_turn(self.grill,self.r,waiting_player.dominos)
+        if PROFILER.enabled:
+            PROFILER.count("turns")
+            tic = time.perf_counter()
         player_score = self.play_dice_part(playing_player)
+        if PROFILER.enabled:
+            PROFILER.add("play_dice_part", tic)
+            tic = time.perf_counter()
         player_selection = self.play_grill_part(playing_player, player_score)
+        if PROFILER.enabled:
+            PROFILER.add("play_grill_part", tic)
 
         if player_selection == player_score:#stealing is possible
             if waiting_player.dominos and player_selection == waiting_player.dominos[-1]:
-                logging.info(f"steals {player_selection}")
+                if TRACER.enabled:
+                    TRACER.emit(STEAL, player_selection)
+                if PROFILER.enabled:
+                    PROFILER.count("steals")
                 playing_player.dominos.append(waiting_player.dominos.pop(-1))
                 #new turn
                 playing_player, waiting_player = waiting_player, playing_player
                 return 2*self.r[player_selection-self.domino_min]
         
         if player_selection != -1 and self.grill[player_selection-self.domino_min]:#The playing player has chosen a domino
-            logging.info(f"takes {player_selection}")
+            if TRACER.enabled:
+                TRACER.emit(TAKE, player_selection)
             self.grill[player_selection-self.domino_min] = False
             playing_player.dominos.append(player_selection) 
             return self.r[player_selection-self.domino_min]
@@ -93,10 +123,12 @@ class Game:
             res = 0
             if playing_player.dominos:
                 lost_domino = playing_player.dominos.pop(-1)
-                logging.info(f"looses domino {lost_domino}")
+                if TRACER.enabled:
+                    TRACER.emit(LOSE, lost_domino)
                 res = -self.r[lost_domino-self.domino_min]
             else:
-                logging.info("looses turn")
+                if TRACER.enabled:
+                    TRACER.emit(LOSE_TURN)
 
             for i in range(self.domino_max, self.domino_min-1, -1):
                 if self.grill[i-self.domino_min] and i != lost_domino:
@@ -112,14 +144,14 @@ class Game:
         """
 
         playing_player, waiting_player = self.playerA, self.playerB
+        if PROFILER.enabled:
+            PROFILER.count("games")
         
         while not(self.over()):
             if display:
                 print(self)
-            if playing_player == self.playerA:
-                logging.info("A plays")
-            else:
-                logging.info("B plays")
+            if TRACER.enabled:
+                TRACER.emit(PLAYS, 0 if playing_player == self.playerA else 1)
             
             self.play_turn(playing_player, waiting_player)
             playing_player, waiting_player = waiting_player, playing_player 
@@ -138,58 +170,126 @@ class Game:
         
 
 class GD:
+    """Gradient descent on (alpha, beta) of a PlayerAB playing against PlayerAB(1, 1).
+
+    At each epoch, all the probe points of the finite-difference scheme are evaluated together by
+    run_tournament, in parallel and with common random numbers: the i-th game of every probe point is
+    played with the same dice, so the per-game differences between probe points have a low variance.
+
+    Modes of the gradient estimation:
+    - "forward": (f(a+h, b) - f(a, b))/h and (f(a, b+h) - f(a, b))/h, 3 probe points
+    - "central": (f(a+h, b) - f(a-h, b))/2h and (f(a, b+h) - f(a, b-h))/2h, 4 probe points
+    - "spsa": (f(theta + h*delta) - f(theta - h*delta))/(2h*delta) with a random delta in {-1, 1}^2, 2 probe points
 
-    def __init__(self, n_epochs, n_batchs, h = 0.01, lr = 0.1) -> None:
+    With common random numbers, the games played by a probe point only change when a decision of the player
+    changes, so the estimated objective is piecewise constant in (alpha, beta): a step h too small to change
+    any decision gives a gradient of exactly 0. With h = 0.01, the forward gradient of `python game.py` is 0 in
+    9 epochs out of 10, with h = 0.2 (the default) in 1 epoch out of 10.
+
+    :param n_epochs: number of epochs
+    :type n_epochs: int
+    :param n_batchs: number of games played per probe point at each epoch
+    :type n_batchs: int
+    :param h: step of the finite differences, large enough to change the decisions of the player
+    :type h: float
+    :param lr: learning rate, applied to the gradient
+    :type lr: float
+    :param mode: gradient estimation, "forward", "central" or "spsa"
+    :type mode: str
+    :param max_workers: number of processes used by run_tournament
+    :type max_workers: int, optional
+    :param batch_size: number of games of a task of run_tournament, fixed so that the random streams, and thus the
+        estimations, only depend on the seed and not on the number of workers
+    :type batch_size: int
+    :param seed: master seed of the games
+    :type seed: int
+    """
+
+    def __init__(self, n_epochs, n_batchs, h = 0.2, lr = 0.001, mode = "forward", max_workers = None, batch_size = 10, seed = 0) -> None:
+        if mode not in ("forward", "central", "spsa"):
+            raise ValueError(f"unknown mode {mode}")
         self.n_epochs = n_epochs
         self.n_batchs = n_batchs
         self.h = h
         self.lr = lr
-        
+        self.mode = mode
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
         self.epoch = 1
         self.alpha = 1
         self.beta = 1
 
         self.alphas = [1]
         self.betas = [1]
+        self.gradients = []
+        self.variances = [] # variance of the estimation of each component of the gradient
+        self.timings = []
+
+    def evaluate(self, points: list, seed: int = 0) -> np.ndarray:
+        """Plays n_batchs games for each point against PlayerAB(1, 1) with common random numbers
+
+        :param points: list of (alpha, beta)
+        :type points: list
+        :return: minus the score differences (descent so negative), shape (len(points), n_batchs)
+        :rtype: np.ndarray
+        """
+        from tournament import PlayerConfig, run_tournament
+        configs = [PlayerConfig(PlayerAB, a, b) for a, b in points]
+        results = run_tournament(configs, PlayerConfig(PlayerAB, 1, 1), self.n_batchs, batch_size=self.batch_size, max_workers=self.max_workers,
+                                 seed=seed, return_scores=True, common_random_numbers=True)
+        return -np.array([stats["scores"] for stats in results])
 
-        self.playerA = PlayerAB()
-        self.playerB = PlayerAB()
-        self.playerB.set_ab(1,1)
-        self.game = Game(self.playerA, self.playerB)
-    
     def simu(self, a, b) -> float:
-        self.playerA.set_ab(a, b)
-        res = 0
-        for batch in range(self.n_batchs):
-            self.game.reinit()
-            self.game.play_game(display=False)
-            res -= self.game.score("A") - self.game.score("B") # descent so negative
-        return res/self.n_batchs
+        return self.evaluate([(a, b)], seed=self.seed).mean()
+
+    def estimate_gradient(self, seed: int = 0):
+        """Estimates the gradient at (alpha, beta)
+
+        :return: (gradient, variance of the estimation of each component)
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        a, b, h = self.alpha, self.beta, self.h
+        if self.mode == "forward":
+            f = self.evaluate([(a, b), (a + h, b), (a, b + h)], seed)
+            samples = np.stack((f[1] - f[0], f[2] - f[0]), axis=1) / h
+        elif self.mode == "central":
+            f = self.evaluate([(a + h, b), (a - h, b), (a, b + h), (a, b - h)], seed)
+            samples = np.stack((f[0] - f[1], f[2] - f[3]), axis=1) / (2*h)
+        else:
+            delta = self.rng.choice([-1, 1], size=2)
+            f = self.evaluate([(a + h*delta[0], b + h*delta[1]), (a - h*delta[0], b - h*delta[1])], seed)
+            samples = (f[0] - f[1])[:, None] / (2*h*delta[None, :])
+        variance = samples.var(axis=0, ddof=1) / len(samples) if len(samples) > 1 else np.zeros(2)
+        return samples.mean(axis=0), variance
 
     def gradient_descent(self):
         for epoch in range(self.n_epochs):
-            print(epoch)
-
-            fab = self.simu(self.alpha, self.beta)
-            fahb = self.simu(self.alpha + self.h, self.beta)
-            fabh = self.simu(self.alpha, self.beta + self.h)
+            tic = time.time()
+            gradient, variance = self.estimate_gradient(seed=self.seed + epoch)
 
-            self.alpha -= (fahb - fab) * (self.lr/self.epoch)
-            self.beta -= (fabh - fab) * (self.lr/self.epoch)
+            self.alpha -= gradient[0] * (self.lr/self.epoch)
+            self.beta -= gradient[1] * (self.lr/self.epoch)
 
             self.alphas.append(self.alpha)
             self.betas.append(self.beta)
+            self.gradients.append(gradient)
+            self.variances.append(variance)
+            self.timings.append(time.time() - tic)
+            print(f"epoch {epoch}: gradient {gradient} (std {np.sqrt(variance)}), {self.timings[-1]:.2f}s")
 
 if __name__ == "__main__":
 
-    log_path = 'game.log'
+    trace_path = 'game.trace'
     try:
-        os.remove(log_path)
+        os.remove(trace_path)
     except OSError:
         pass
-    logging.basicConfig(filename=log_path, level=logging.NOTSET, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    TRACER.enable(BinaryFile(trace_path))
 
     gd = GD(10, 3)
     gd.gradient_descent()
 
-    logging.shutdown()
\ No newline at end of file
+    TRACER.disable()
\ No newline at end of file
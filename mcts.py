@@ -0,0 +1,254 @@
+import itertools
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from game import *
+from state import MAX_DOMINOS
+
+# (alpha, beta) among which the searching player chooses at each turn
+CANDIDATES = tuple((alpha, beta) for alpha in (0.25, 0.5, 1, 2, 4) for beta in (0.5, 1, 2))
+
+
+class Node:
+    """Position at the beginning of a turn of the searching player, with the statistics of each action"""
+
+    __slots__ = ("visits", "action_visits", "action_values")
+
+    def __init__(self, n_actions: int) -> None:
+        self.visits = 0
+        self.action_visits = np.zeros(n_actions)
+        self.action_values = np.zeros(n_actions)
+
+
+class TurnSearch:
+    """Monte Carlo tree search over whole turns.
+
+    An action is the (alpha, beta) used by the searching player for a turn, the turn being played by
+    Game.play_turn with the strategy tables of PlayerAB. A transition plays the turn of the searching player
+    then the turn of the opponent, so the nodes are the positions at the beginning of a turn of the searching
+    player. Nodes are stored in a transposition table keyed by the serialized GameState, so the positions
+    reached by different paths share their statistics, and the table is kept from one move to the next.
+    The leaves are evaluated by a rollout to the end of the game with fixed (alpha, beta), whose tables are
+    cached in the shared store. The value of a game is 1 if the searching player wins, 0.5 for a draw and 0 if
+    they lose.
+
+    :param candidates: (alpha, beta) among which the searching player chooses
+    :type candidates: tuple
+    :param opponent: (alpha, beta) of the opponent
+    :type opponent: tuple
+    :param rollout: (alpha, beta) of the searching player in the rollouts
+    :type rollout: tuple
+    :param exploration: exploration constant of UCB1
+    :type exploration: float
+    :param max_nodes: size of the transposition table above which no node is added
+    :type max_nodes: int
+    :param seed: seed of the dice
+    :type seed: int, optional
+    """
+
+    def __init__(self, N_dice = 8, domino_min = 21, domino_max = 36, r = [1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4], candidates: tuple = CANDIDATES, opponent: tuple = (1, 1), rollout: tuple = (1, 1), exploration: float = 0.5, max_nodes: int = 200000, seed=None) -> None:
+        self.candidates = candidates
+        self.rollout_ab = rollout
+        self.exploration = exploration
+        self.max_nodes = max_nodes
+        self.me = PlayerAB(N_dice=N_dice, domino_min=domino_min, domino_max=domino_max, r=list(r))
+        self.adv = PlayerAB(N_dice=N_dice, domino_min=domino_min, domino_max=domino_max, r=list(r))
+        self.adv.set_ab(*opponent)
+        self.game = Game(self.me, self.adv, N_dice, domino_min, domino_max, list(r), dice=DiceSource(seed))
+        self.table = {}
+
+    def load(self, state: GameState) -> None:
+        """Puts the simulated game in the given state, the searching player being side 0"""
+        state.to_game(self.game)
+
+    def outcome(self) -> float:
+        difference = self.game.score('A') - self.game.score('B')
+        return(1. if difference > 0 else 0.5 if difference == 0 else 0.)
+
+    def select(self, node: Node) -> int:
+        """Chooses an action by UCB1, the actions never tried first"""
+        untried = np.flatnonzero(node.action_visits == 0)
+        if len(untried):
+            return(int(untried[0]))
+        ucb = node.action_values/node.action_visits + self.exploration*np.sqrt(np.log(node.visits)/node.action_visits)
+        return(int(np.argmax(ucb)))
+
+    def rollout(self) -> float:
+        """Plays the simulated game to its end from a turn of the searching player"""
+        self.me.set_ab(*self.rollout_ab)
+        while not self.game.over():
+            self.game.play_turn(self.me, self.adv)
+            if not self.game.over():
+                self.game.play_turn(self.adv, self.me)
+        return(self.outcome())
+
+    def simulate(self, root: GameState) -> None:
+        """Runs one iteration of the search: selection, expansion, rollout and backpropagation"""
+        self.load(root)
+        path = []
+        while True:
+            key = GameState.from_game(self.game).to_bytes()
+            node = self.table.get(key)
+            if node is None:
+                if len(self.table) < self.max_nodes:
+                    self.table[key] = Node(len(self.candidates))
+                value = self.rollout()
+                break
+            action = self.select(node)
+            path.append((node, action))
+            self.me.set_ab(*self.candidates[action])
+            self.game.play_turn(self.me, self.adv)
+            if not self.game.over():
+                self.game.play_turn(self.adv, self.me)
+            if self.game.over():
+                value = self.outcome()
+                break
+        for node, action in path:
+            node.visits += 1
+            node.action_visits[action] += 1
+            node.action_values[action] += value
+
+    def search(self, root: GameState, n_rollouts: int = None, time_budget: float = None, seed=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Searches from the given position until the budget is spent
+
+        :param root: position at the beginning of a turn of the searching player (side 0)
+        :type root: GameState
+        :param n_rollouts: number of iterations
+        :type n_rollouts: int, optional
+        :param time_budget: time of the search in seconds, used if n_rollouts is not given
+        :type time_budget: float, optional
+        :param seed: seed of the dice for this search
+        :type seed: optional
+        :return: visits and total value added to each action at the root by this search, the table kept from
+            the previous searches being excluded
+        :rtype: Tuple[np.ndarray, np.ndarray]
+        """
+        if n_rollouts is None and time_budget is None:
+            raise ValueError("a number of rollouts or a time budget is needed")
+        if seed is not None:
+            self.game.dice = DiceSource(seed)
+        node = self.table.get(root.to_bytes())
+        visits = np.zeros(len(self.candidates)) if node is None else node.action_visits.copy()
+        values = np.zeros(len(self.candidates)) if node is None else node.action_values.copy()
+        # The simulated games are not part of the trace and of the counters of the real game
+        tracing, profiling = TRACER.enabled, PROFILER.enabled
+        TRACER.enabled = PROFILER.enabled = False
+        try:
+            end = time.perf_counter() + time_budget if n_rollouts is None else None
+            i = 0
+            while (i < n_rollouts) if end is None else (time.perf_counter() < end):
+                self.simulate(root)
+                i += 1
+        finally:
+            TRACER.enabled, PROFILER.enabled = tracing, profiling
+        node = self.table.get(root.to_bytes())
+        if node is None:
+            return(np.zeros(len(self.candidates)), np.zeros(len(self.candidates)))
+        return(node.action_visits - visits, node.action_values - values)
+
+
+# Searches of a process by player, kept from one move to the next with their transposition table
+_SEARCHES = {}
+_PLAYER_IDS = itertools.count()
+
+
+def _search_task(task):
+    key, params, root, n_rollouts, time_budget, seed = task
+    search = _SEARCHES.get(key)
+    if search is None:
+        search = _SEARCHES[key] = TurnSearch(**dict(params))
+    return(search.search(GameState.from_bytes(root), n_rollouts, time_budget, seed))
+
+
+class MCTSPlayer(PlayerAB):
+    """Player choosing its (alpha, beta) at the beginning of each turn by a Monte Carlo tree search over whole turns.
+
+    The search is run in init_turn, then the turn is played as a PlayerAB with the (alpha, beta) of the most
+    visited action, so the player can be used in Game as any other player. With workers, the search is
+    root-parallel: every task searches the same position with its own dice in the transposition table of this
+    player in its worker process, and the visits each task added to the root actions are summed.
+    The worker processes are stopped by close(), at the end of a with block or when the player is collected.
+
+    :param n_rollouts: number of iterations per move (per worker)
+    :type n_rollouts: int, optional
+    :param time_budget: time of the search per move in seconds, used if n_rollouts is None
+    :type time_budget: float, optional
+    :param n_workers: number of worker processes, 0 searches in this process
+    :type n_workers: int
+    :param search_params: parameters of TurnSearch (candidates, opponent, rollout, exploration, max_nodes)
+    :type search_params: dict, optional
+    :param seed: seed of the searches
+    :type seed: int, optional
+    """
+
+    def __init__(self, n_rollouts: int = 200, time_budget: float = None, n_workers: int = 0, search_params: dict = None, seed=None, N_dice = 8, domino_min = 21, domino_max = 36, r = [1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4]) -> None:
+        super().__init__(True, N_dice, domino_min, domino_max, r)
+        self.n_rollouts = n_rollouts
+        self.time_budget = time_budget
+        self.n_workers = n_workers
+        self.params = tuple(sorted(dict(search_params or {}, N_dice=N_dice, domino_min=domino_min, domino_max=domino_max, r=tuple(r)).items()))
+        self.candidates = dict(self.params).get("candidates", CANDIDATES)
+        self.seeds = np.random.SeedSequence(seed)
+        self.key = (os.getpid(), next(_PLAYER_IDS))
+        self.executor = None
+        self.last_visits = None
+
+    def search(self, state: GameState) -> np.ndarray:
+        """Searches from the given position and returns the visits of each candidate"""
+        tasks = [(self.key, self.params, state.to_bytes(), self.n_rollouts, self.time_budget, seed)
+                 for seed in self.seeds.spawn(max(self.n_workers, 1))]
+        if self.n_workers == 0:
+            results = [_search_task(tasks[0])]
+        else:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.n_workers)
+            results = list(self.executor.map(_search_task, tasks))
+        return(sum(visits for visits, _ in results))
+
+    def init_turn(self, grill: list[bool], r: list[int], dominos_adv: list[int]):
+        state = GameState(len(grill), sum(1 << i for i, available in enumerate(grill) if available))
+        for side, dominos in enumerate((self.dominos, dominos_adv)):
+            state.heights[side] = len(dominos)
+            state.stacks[side*MAX_DOMINOS:side*MAX_DOMINOS + len(dominos)] = bytes(dominos)
+        self.last_visits = self.search(state)
+        self.set_ab(*self.candidates[int(np.argmax(self.last_visits))])
+        super().init_turn(grill, r, dominos_adv)
+
+    def close(self) -> None:
+        """Stops the worker processes and drops the search of this process"""
+        _SEARCHES.pop(self.key, None)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self) -> "MCTSPlayer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        # A player dropped without close() does not leave its worker processes behind
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+if __name__ == "__main__":
+
+    from tournament import summarize
+
+    rules = dict(N_dice=4, domino_min=11, domino_max=18, r=[1, 1, 2, 2, 3, 3, 4, 4])
+    player = MCTSPlayer(n_rollouts=100, seed=0, **rules)
+    opponent = PlayerAB(**rules)
+    game = Game(player, opponent, **rules, dice=DiceSource(0))
+    res = []
+    tic = time.time()
+    for i in range(20):
+        game.reinit()
+        game.play_game(display=False)
+        res.append(game.score('A') - game.score('B'))
+    player.close()
+    stats = summarize(np.array(res))
+    print(f"MCTSPlayer against PlayerAB(1, 1): {stats['mean']:.2f} +/- {stats['sem']:.2f}, {stats['wins']} wins, {stats['losses']} losses in {time.time() - tic:.0f}s")
@@ -1,7 +1,9 @@
 import functools
 import time
-import logging
+from tracing import TRACER, TURN, CHOICE
+from profiling import PROFILER
 from tools import *
+from tables import STORE
 from typing import Tuple
 
 
@@ -18,26 +20,67 @@ class Player:
         self.dominos = []
         self.clear_cache = True
         self.eval = None
+        self.table = None
+        self.last_table = None
 
     def reinit(self) -> None:
         self.C = 0
         self.r = self.basic_r
         self.dominos = []
+        self.table = None
+
+    def restore(self, grill: list[bool], dominos: list[int]) -> None:
+        """Puts the player in a position of a game, as between two turns: its stack is set, C is reset and r is
+        rebuilt from basic_r and the grill (init_turn sets them again at the next turn)
+
+        :param grill: game grill
+        :type grill: list[bool]
+        :param dominos: stack of the player, top last
+        :type dominos: list[int]
+        """
+        self.dominos = list(dominos)
+        self.set_C(0)
+        self.set_r([reward if available else -self.C for reward, available in zip(self.basic_r, grill)])
+        self.table = None
 
     def set_C(self, new_C: int):
         if self.clear_cache:
-            logging.debug("cache clear")
-            self.expectancy.cache_clear()
-            #self.strategy.cache_clear()
+            self.table = None
         self.C = new_C
 
     def set_r(self, new_r: list[int]):
         if self.clear_cache:
-            logging.debug("cache clear")
-            self.expectancy.cache_clear()
-            #self.strategy.cache_clear()
+            self.table = None
         self.r = new_r.copy()
 
+    def table_key(self) -> tuple:
+        """Key of the strategy table of the player.
+
+        The solution of a turn depends on (C, r, adv, N_dice, domino range) only through the reward of a failed turn
+        and the reward obtained by stopping with each score, so these rewards are used as key. Players with
+        the same rewards share the same table.
+
+        :return: (N_dice, fail_reward, stop_rewards)
+        :rtype: tuple
+        """
+        stop_rewards = tuple(self.rewardfun(score, 1) for score in range(5*self.N_dice + 1))
+        return (self.N_dice, -self.C, stop_rewards)
+
+    def get_table(self):
+        """Returns the strategy table matching the current parameters of the player, looked up in the shared store
+
+        A missing table is solved by updating the last table of the player, whose rewards usually only differ
+        in the scores of the dominos taken since.
+        """
+        if self.table is None:
+            if PROFILER.enabled:
+                tic = time.perf_counter()
+            self.table = STORE.get(self.table_key(), base=self.last_table)
+            self.last_table = self.table
+            if PROFILER.enabled:
+                PROFILER.add("table_lookup", tic)
+        return self.table
+
 
     def rewardfun(self, score : int, previous_choices : int) -> int:
         if score < self.domino_min:
@@ -62,7 +105,8 @@ class Player:
             if not available:
                 new_r[i] = -self.C
         self.set_r(new_r)
-        logging.debug(f"Reward vector at this turn: {self.r}")
+        if TRACER.enabled:
+            TRACER.emit(TURN, self.C)
 
 
     def play_dice(self, dice_results : tuple, previous_choices : int, nb_available_dice : int, score : int) -> int:
@@ -80,7 +124,8 @@ class Player:
         :rtype: int
         """
         choice, reward = self.strategy(dice_results, previous_choices, nb_available_dice, score)
-        logging.info(f"chooses {choice} with reward {reward}")
+        if TRACER.enabled and choice is not None:
+            TRACER.emit(CHOICE, choice[0], choice[1], reward)
         return(choice)
     
     def play_grill(self, grill, score : int) -> int:
@@ -99,7 +144,6 @@ class Player:
         domino = domino if self.r[domino-self.domino_min] > 0 else -1
         return(domino)
     
-    @functools.cache
     def expectancy(self, choices: int, nb_available_dice: int, score : int) -> float:
         """Returns the expected reward with the given situation
 
@@ -112,15 +156,16 @@ class Player:
         :return: expected reward
         :rtype: float
         """
-        return(sum(
-                        proba(dice_output, nb_available_dice) 
-                        * self.strategy(dice_output, choices, nb_available_dice, score)[1]
-                    for dice_output in all_possible_dice_outputs(nb_available_dice)
-                    )
-               )
-    
-    
-    @functools.cache
+        return(self.get_table().expectancy(choices, nb_available_dice, score))
+
+    def outcome_distribution(self, choices: int = 0, nb_available_dice: int = None, score: int = 0) -> np.ndarray:
+        """Returns the exact distribution of the result of the turn played from the given situation
+
+        :return: probability of stopping with each score 0 to 5*N_dice, then probability of failing the turn
+        :rtype: np.ndarray
+        """
+        return(self.get_table().outcome_distribution(choices, nb_available_dice, score))
+
     def strategy(self, dice_results : tuple, previous_choices : int, nb_available_dice : int, score : int) -> Tuple[Tuple[int, int], int]:
         """Computes the optimal strategy using Bellman equation.
 
@@ -135,35 +180,7 @@ class Player:
         :return: (choice, expectancy).  choice = (chosen dice, 0 if player stops or 1 otherwise)
         :rtype: Tuple[Tuple[int, int], int]
         """
-
-        #Test all possible choices
-        possible_choices = [i for i, dr in enumerate(dice_results) if dr and( not ((previous_choices >> i) & 1))]
-        if not possible_choices:#the round is failed
-            return((None, -self.C))
-        # select the choice that have the best expectancy
-        reward_temp = float('-inf')
-        choice_temp = (-1, -1)
-        for choice in possible_choices: # all other possible choices
-            #Compute previous_choices, score and nb_available_dice for the potential choice
-            new_choices = previous_choices | (1 << choice)
-            new_score = score + (choice if choice else 5)*dice_results[choice]
-            new_nb_available_dice = nb_available_dice - dice_results[choice]
-                
-            #Compute the expected reward of the choice
-            expected_reward_continuing = self.expectancy(new_choices, new_nb_available_dice, new_score) 
-            if new_choices % 2 == 1 and self.rewardfun(new_score, new_choices) >= expected_reward_continuing: #The player should stop after chosing choice
-                reward_by_stopping = self.rewardfun(new_score, new_choices)  
-                reward = reward_by_stopping
-                pchoice = (choice, 0)
-            else:
-                reward = expected_reward_continuing
-                pchoice = (choice, 1)
-                
-            if reward >= reward_temp:
-                reward_temp = reward
-                choice_temp = pchoice
-                
-        return(choice_temp, reward_temp)
+        return(self.get_table().strategy(dice_results, previous_choices, nb_available_dice, score))
 
 class PlayerAB(Player):
 
@@ -212,8 +229,8 @@ class PlayerAB(Player):
 
 
 class Player_select_Tile_equal_score(Player):
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, N_dice = 8, domino_min = 21, domino_max = 36, r = [1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4]) -> None:
+        super().__init__(N_dice, domino_min, domino_max, r)
         
     def rewardfun(self, score : int, previous_choices : int) -> int:
         if score < self.domino_min or score > self.domino_max or previous_choices % 2 == 0:
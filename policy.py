@@ -0,0 +1,188 @@
+import numpy as np
+from game import *
+from encoding import STATE_SIZE, encode_state
+
+
+def export_actor(net, path: str = None) -> dict:
+    """Exports the weights of an agent.Actor as NumPy arrays, to be run by NumpyActor without torch
+
+    :param net: network exported
+    :type net: agent.Actor
+    :param path: if given, the weights are also saved in this .npz file
+    :type path: str, optional
+    :return: weights of the network, keyed as in its state_dict
+    :rtype: dict
+    """
+    params = {name: tensor.detach().cpu().numpy().astype(np.float32) for name, tensor in net.state_dict().items()}
+    if path is not None:
+        np.savez(path, **params)
+    return(params)
+
+
+class NumpyActor:
+    """Forward pass of agent.Actor with NumPy only, for CPU inference workers which do not import torch.
+
+    The three heads (alpha, beta, value) are stacked in a single matrix, so a batch of states takes two
+    matrix products.
+
+    :param params: weights exported by export_actor
+    :type params: dict
+    """
+
+    def __init__(self, params: dict) -> None:
+        self.base_weight = np.ascontiguousarray(params["base.0.weight"].T)
+        self.base_bias = params["base.0.bias"]
+        self.head_weight = np.ascontiguousarray(np.concatenate([params[f"{head}.0.weight"] for head in ("alpha", "beta", "value")]).T)
+        self.head_bias = np.concatenate([params[f"{head}.0.bias"] for head in ("alpha", "beta", "value")])
+
+    @staticmethod
+    def load(path: str) -> "NumpyActor":
+        with np.load(path) as params:
+            return(NumpyActor(dict(params)))
+
+    def __call__(self, states: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Runs the network on a batch of states
+
+        :param states: states of shape (N, STATE_SIZE), encoded as encoding.encode_state
+        :type states: np.ndarray
+        :return: alpha, beta and value, each of shape (N,)
+        :rtype: Tuple[np.ndarray, np.ndarray, np.ndarray]
+        """
+        hidden = np.maximum(states @ self.base_weight + self.base_bias, 0)
+        out = hidden @ self.head_weight + self.head_bias
+        # Same as torch.nn.Softplus, linear above its threshold of 20
+        ab = np.where(out[:, :2] > 20, out[:, :2], np.log1p(np.exp(np.minimum(out[:, :2], 20))))
+        value = 0.5*(1 + np.tanh(0.5*out[:, 2]))
+        return ab[:, 0], ab[:, 1], value
+
+
+class PolicyServer:
+    """Gathers the policy requests of many games and answers them with one forward pass of the network.
+
+    Each request gives a PlayerAB and its state, the (alpha, beta) computed by the network are set on the
+    player when the pending requests are flushed. The model is either an agent.Actor, run under
+    torch.inference_mode, or a NumpyActor. States are encoded in a buffer reused from one batch to the next.
+
+    :param model: network choosing (alpha, beta)
+    :type model: agent.Actor or NumpyActor
+    :param max_batch: number of pending requests above which they are flushed
+    :type max_batch: int
+    """
+
+    def __init__(self, model, max_batch: int = 1024) -> None:
+        self.model = model
+        self.max_batch = max_batch
+        self.buffer = np.zeros((max_batch, STATE_SIZE), dtype=np.float32)
+        self.pending = []
+        self.n_batches = 0
+        self.n_states = 0
+
+    def request(self, player: PlayerAB, grill: list, me: list, adv: list) -> None:
+        """Adds a request of the player for the given state, the state being copied
+
+        :param player: player whose (alpha, beta) are set at the next flush
+        :type player: PlayerAB
+        :param grill: available dominos
+        :type grill: list[bool]
+        :param me: stack of the player, top last
+        :type me: list[int]
+        :param adv: stack of the adversary, top last
+        :type adv: list[int]
+        """
+        encode_state(self.buffer[len(self.pending)], grill, me, adv)
+        self.pending.append(player)
+        if len(self.pending) == self.max_batch:
+            self.flush()
+
+    def forward(self, states: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Runs the model on a batch of encoded states, returns alpha, beta and value as arrays of shape (N,)"""
+        if isinstance(self.model, NumpyActor):
+            return self.model(states)
+        import torch
+        with torch.inference_mode():
+            alpha, beta, value = self.model(torch.from_numpy(states))
+        return alpha[:, 0].numpy(), beta[:, 0].numpy(), value[:, 0].numpy()
+
+    def flush(self) -> np.ndarray:
+        """Answers all the pending requests
+
+        :return: value of the state of each request
+        :rtype: np.ndarray
+        """
+        n = len(self.pending)
+        if not n:
+            return(np.zeros(0, dtype=np.float32))
+        if PROFILER.enabled:
+            tic = time.perf_counter()
+        alpha, beta, value = self.forward(self.buffer[:n])
+        if PROFILER.enabled:
+            PROFILER.add("forward", tic)
+        for player, a, b in zip(self.pending, alpha.tolist(), beta.tolist()):
+            player.set_ab(a, b)
+        self.pending.clear()
+        self.n_batches += 1
+        self.n_states += n
+        return(value)
+
+
+def play_games(server: PolicyServer, games: list, opponent_server: PolicyServer = None) -> np.ndarray:
+    """Plays several games at once, player A choosing its (alpha, beta) at each turn with the policy server.
+
+    The games are played turn by turn in lockstep: before the turns of player A, the requests of all the games
+    still running are answered by a single flush of the server.
+
+    :param server: policy of player A, a PlayerAB
+    :type server: PolicyServer
+    :param games: games played from their current position
+    :type games: list[Game]
+    :param opponent_server: policy of player B if it is also driven by a network, fixed (alpha, beta) otherwise
+    :type opponent_server: PolicyServer, optional
+    :return: score difference (A - B) of each game
+    :rtype: np.ndarray
+    """
+    running = [game for game in games if not game.over()]
+    while running:
+        for game in running:
+            server.request(game.playerA, game.grill, game.playerA.dominos, game.playerB.dominos)
+        server.flush()
+        for game in running:
+            game.play_turn(game.playerA, game.playerB)
+        running = [game for game in running if not game.over()]
+        if opponent_server is not None:
+            for game in running:
+                opponent_server.request(game.playerB, game.grill, game.playerB.dominos, game.playerA.dominos)
+            opponent_server.flush()
+        for game in running:
+            game.play_turn(game.playerB, game.playerA)
+        running = [game for game in running if not game.over()]
+    return(np.array([game.score('A') - game.score('B') for game in games]))
+
+
+if __name__ == "__main__":
+
+    from agent import Actor, state2tensor
+
+    net = Actor()
+    actor = NumpyActor(export_actor(net))
+    games = [Game(PlayerAB(), PlayerAB(), dice=DiceSource(i)) for i in range(100)]
+    for game in games:
+        game.reinit()
+
+    # Per-state forward, as in the training loop of agent.py
+    tic = time.time()
+    for game in games:
+        alpha, beta, val = net(state2tensor(game.grill, game.playerA.dominos, game.playerB.dominos))
+        game.playerA.set_ab(alpha.item(), beta.item())
+    print(f"per state: {1e6*(time.time() - tic)/len(games):.1f}us/state")
+
+    for model in (net, actor):
+        server = PolicyServer(model)
+        tic = time.time()
+        for game in games:
+            server.request(game.playerA, game.grill, game.playerA.dominos, game.playerB.dominos)
+        server.flush()
+        print(f"{type(model).__name__} batched: {1e6*(time.time() - tic)/len(games):.1f}us/state")
+
+    tic = time.time()
+    scores = play_games(PolicyServer(actor), games)
+    print(f"{len(games)} games in {time.time() - tic:.1f}s, mean score difference {scores.mean():.2f}")
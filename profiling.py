@@ -0,0 +1,136 @@
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from tables import STORE
+
+
+class Profiler:
+    """Counters and timers of the engine.
+
+    As for the tracer, the code on the hot path checks `PROFILER.enabled` before counting or reading the
+    clock, so a disabled profiler costs a single attribute lookup per phase. The counters of the table store
+    (solves, hits, states expanded) are taken as differences between the start and the end of the profiling.
+    Only the current process is profiled, not the workers of a tournament.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.reset()
+
+    def reset(self) -> None:
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.spans = []
+        self.record_spans = False
+        self.max_spans = 1000000
+        self.origin = time.perf_counter()
+        self.duration = 0.
+        self._store = None
+
+    def start(self, spans: bool = False) -> None:
+        """Resets the counters and starts profiling
+
+        :param spans: also record every timed phase, for export_chrome_trace
+        :type spans: bool
+        """
+        self.reset()
+        self.record_spans = spans
+        self._store = STORE.stats()
+        self.enabled = True
+
+    def stop(self) -> None:
+        self.enabled = False
+        self.duration = time.perf_counter() - self.origin
+        store = STORE.stats()
+        self.counts["table_hits"] += store["hits"] - self._store["hits"]
+        self.counts["table_solves"] += store["misses"] - self._store["misses"] - (store["disk_hits"] - self._store["disk_hits"])
+        self.counts["table_loads"] += store["disk_hits"] - self._store["disk_hits"]
+        self.counts["states_expanded"] += store["states_solved"] - self._store["states_solved"]
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counts[name] += n
+
+    def add(self, name: str, start: float) -> None:
+        """Adds the time elapsed since start (time.perf_counter) to the phase name"""
+        end = time.perf_counter()
+        self.times[name] += end - start
+        self.calls[name] += 1
+        if self.record_spans and len(self.spans) < self.max_spans:
+            self.spans.append((name, start, end - start))
+
+    def summary(self) -> dict:
+        """Returns the counters, the time of each phase and the counts per game
+
+        :return: duration, counts, per_game, times (phase: (calls, total time in s))
+        :rtype: dict
+        """
+        games = self.counts.get("games", 0)
+        per_game = {f"{name}_per_game": n/games for name, n in self.counts.items() if games and name in ("turns", "throws", "steals")}
+        solves = self.counts.get("table_solves", 0)
+        if solves:
+            per_game["states_per_solve"] = self.counts["states_expanded"]/solves
+        return {
+            "duration": self.duration,
+            "counts": dict(self.counts),
+            "per_game": per_game,
+            "times": {name: (self.calls[name], total) for name, total in self.times.items()},
+        }
+
+    def report(self) -> str:
+        """Formats the summary in a human readable way"""
+        summary = self.summary()
+        lines = [f"profiled {summary['duration']:.3f}s"]
+        for name, n in sorted(summary["counts"].items()):
+            lines.append(f"  {name:24}{n:>12}")
+        for name, value in summary["per_game"].items():
+            lines.append(f"  {name:24}{value:>12.2f}")
+        for name, (calls, total) in sorted(summary["times"].items(), key=lambda item: -item[1][1]):
+            share = total/summary["duration"] if summary["duration"] else 0.
+            lines.append(f"  {name:24}{calls:>12} calls {total:10.4f}s {100*share:6.1f}%  {1e6*total/calls:10.1f}us/call")
+        return("\n".join(lines))
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Writes the spans recorded in the Chrome trace event format, read by chrome://tracing, Perfetto or speedscope"""
+        pid = os.getpid()
+        events = [{"name": name, "ph": "X", "ts": 1e6*(start - self.origin), "dur": 1e6*duration, "pid": pid, "tid": 0}
+                  for name, start, duration in self.spans]
+        for name, n in self.counts.items():
+            events.append({"name": name, "ph": "C", "ts": 1e6*self.duration, "pid": pid, "tid": 0, "args": {name: n}})
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+PROFILER = Profiler()
+
+
+@contextmanager
+def profile(spans: bool = False, trace_path: str = None):
+    """Profiles the code run in the context
+
+    :param spans: record every timed phase
+    :type spans: bool
+    :param trace_path: if given, the spans are exported to this file in the Chrome trace event format
+    :type trace_path: str, optional
+    """
+    PROFILER.start(spans or trace_path is not None)
+    try:
+        yield PROFILER
+    finally:
+        PROFILER.stop()
+        if trace_path is not None:
+            PROFILER.export_chrome_trace(trace_path)
+
+
+if __name__ == "__main__":
+
+    from game import *
+
+    game = Game(PlayerAB(), PlayerAB(), dice=DiceSource(0))
+    with profile(trace_path="profile.json") as profiler:
+        for i in range(50):
+            game.reinit()
+            game.play_game(display=False)
+    print(profiler.report())
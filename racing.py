@@ -0,0 +1,161 @@
+import math
+import numpy as np
+from statistics import NormalDist
+from tournament import PlayerConfig, run_tournament, summarize
+
+
+def z_value(confidence: float, n_tests: int) -> float:
+    """Half-width, in standard errors, of two-sided intervals holding all together with the given confidence
+    over n_tests tests (union bound)"""
+    return NormalDist().inv_cdf(1 - (1 - confidence)/(2*max(n_tests, 1)))
+
+
+def play_round(configs: list, opponent: PlayerConfig, n_games: int, seed: int, step: int, max_workers: int = 0) -> np.ndarray:
+    """Plays n_games games of each configuration against the opponent with common random numbers
+
+    The random streams depend on (seed, step) only, so the games of a round are played with the same dice by
+    all the configurations and the rounds of a race are independent.
+
+    :return: score differences, shape (len(configs), n_games)
+    :rtype: np.ndarray
+    """
+    results = run_tournament(configs, opponent, n_games, batch_size=n_games, max_workers=max_workers, seed=[seed, step],
+                             return_scores=True, common_random_numbers=True)
+    return np.array([stats["scores"] for stats in results]).reshape(len(configs), n_games)
+
+
+def evaluate(config: PlayerConfig, opponent: PlayerConfig, threshold: float = 0., confidence: float = 0.95, increment: int = 50, max_games: int = 1000, seed: int = 0, max_workers: int = 0) -> dict:
+    """Plays games in increments until the mean score difference is known to be above or below the threshold.
+
+    After each increment, a confidence interval of the mean is computed; the evaluation stops as soon as it
+    excludes the threshold. The intervals of all the looks hold together with the given confidence (union
+    bound over the maximal number of increments, normal approximation of the mean).
+
+    :param config: player evaluated
+    :type config: PlayerConfig
+    :param opponent: opponent
+    :type opponent: PlayerConfig
+    :param threshold: mean score difference compared with
+    :type threshold: float
+    :param confidence: confidence of the decision
+    :type confidence: float
+    :param increment: number of games played between two looks
+    :type increment: int
+    :param max_games: number of games after which the evaluation stops undecided
+    :type max_games: int
+    :return: statistics of the score difference (see summarize), with "decision": 1 above the threshold, -1 below, 0 undecided
+    :rtype: dict
+    """
+    n_rounds = math.ceil(max_games/increment)
+    z = z_value(confidence, n_rounds)
+    scores = []
+    decision = 0
+    for step in range(n_rounds):
+        scores.append(play_round([config], opponent, increment, seed, step, max_workers)[0])
+        stats = summarize(np.concatenate(scores))
+        if stats["n_games"] > 1 and stats["mean"] - z*stats["sem"] > threshold:
+            decision = 1
+        elif stats["n_games"] > 1 and stats["mean"] + z*stats["sem"] < threshold:
+            decision = -1
+        if decision:
+            break
+    stats["decision"] = decision
+    return stats
+
+
+def race(configs: list, opponent: PlayerConfig, top_k: int = 1, confidence: float = 0.95, tolerance: float = 0., increment: int = 50, max_games: int = 1000, seed: int = 0, max_workers: int = 0) -> dict:
+    """Finds the top_k configurations by racing: games are played in increments and the configurations
+    statistically beaten by top_k others are dropped.
+
+    All the configurations still running play the games of a round with the same dice, so they are compared
+    on paired differences whose variance is much lower than the one of the scores. A configuration j dominates
+    a configuration i when the lower bound of the confidence interval of their paired mean difference (j - i) is
+    above -tolerance. After each round, a configuration is eliminated when it is dominated by at least top_k
+    configurations which survive the round: the configurations are considered from the worst mean to the best so
+    that near ties do not eliminate each other, then the eliminations whose dominators were eliminated
+    afterwards are undone until the survivors do not change. The intervals of all the pairs and rounds hold
+    together with the given confidence (union bound, normal approximation), so with a probability of at least
+    confidence every configuration eliminated is not better by more than tolerance than each of at least top_k
+    configurations still running after the round of its elimination. This does not say that it is worse than
+    the configurations finally kept. The race stops when top_k configurations are left or after max_games games
+    per configuration.
+
+    :param configs: configurations raced
+    :type configs: list[PlayerConfig]
+    :param opponent: opponent of all the configurations
+    :type opponent: PlayerConfig
+    :param top_k: number of configurations kept
+    :type top_k: int
+    :param confidence: confidence of the eliminations
+    :type confidence: float
+    :param tolerance: difference of mean score under which two configurations are considered equivalent
+    :type tolerance: float
+    :param increment: number of games per configuration in a round
+    :type increment: int
+    :param max_games: maximal number of games per configuration
+    :type max_games: int
+    :return: "ranking" (indices of the configurations, best first: survivors by mean, then the eliminated ones by
+        round of elimination), "stats" (see summarize, with "eliminated": round or None, per configuration),
+        "games" (games played) and "fraction" (games played over len(configs)*max_games)
+    :rtype: dict
+    """
+    n = len(configs)
+    n_rounds = math.ceil(max_games/increment)
+    z = z_value(confidence, n*(n - 1)//2*n_rounds)
+    scores = [[] for _ in configs]
+    eliminated = [None]*n
+    alive = np.arange(n)
+    games = 0
+    for step in range(n_rounds):
+        for i, res in zip(alive, play_round([configs[i] for i in alive], opponent, increment, seed, step, max_workers)):
+            scores[i].append(res)
+        games += increment*len(alive)
+        paired = np.array([np.concatenate(scores[i]) for i in alive])
+        differences = paired[:, None, :] - paired[None, :, :]
+        lower = differences.mean(axis=2) - z*differences.std(axis=2, ddof=1)/np.sqrt(paired.shape[1])
+        dominated = lower > -tolerance
+        np.fill_diagonal(dominated, False)
+        running = np.ones(len(alive), dtype=bool)
+        for i in np.argsort(paired.mean(axis=1), kind="stable"):
+            if dominated[running, i].sum() >= top_k:
+                running[i] = False
+        # A dominator counted for an early elimination may have been eliminated afterwards: the eliminations
+        # which are not dominated by top_k survivors are undone, until the survivors do not change
+        while True:
+            restored = ~running & (dominated[running].sum(axis=0) < top_k)
+            if not restored.any():
+                break
+            running |= restored
+        for i in np.flatnonzero(~running):
+            eliminated[alive[i]] = step
+        alive = alive[running]
+        if len(alive) <= top_k:
+            break
+
+    stats = []
+    for i in range(n):
+        res = summarize(np.concatenate(scores[i]))
+        res["eliminated"] = eliminated[i]
+        stats.append(res)
+    ranking = sorted(range(n), key=lambda i: (eliminated[i] is None, -1 if eliminated[i] is None else eliminated[i], stats[i]["mean"]), reverse=True)
+    return {"ranking": ranking, "stats": stats, "games": games, "fraction": games/(n*max_games)}
+
+
+if __name__ == "__main__":
+
+    import time
+
+    rules = dict(N_dice=4, domino_min=11, domino_max=18, r=[1, 1, 2, 2, 3, 3, 4, 4])
+    rng = np.random.default_rng(0)
+    configs = [PlayerConfig(alpha=a, beta=b, **rules) for a, b in rng.uniform(0, 10, (20, 2))]
+    opponent = PlayerConfig(**rules)
+
+    tic = time.time()
+    res = race(configs, opponent, top_k=3, tolerance=0.1, increment=100, max_games=2000)
+    print(f"race: {res['games']} games ({100*res['fraction']:.0f}% of a fixed budget) in {time.time() - tic:.1f}s")
+    for i in res["ranking"][:5]:
+        stats = res["stats"][i]
+        print(configs[i], f"{stats['mean']:.3f} +/- {stats['sem']:.3f} over {stats['n_games']} games, eliminated at round {stats['eliminated']}")
+
+    stats = evaluate(configs[res["ranking"][-1]], opponent, increment=100, max_games=2000)
+    print(f"worst against the opponent: decision {stats['decision']} after {stats['n_games']} games")
@@ -0,0 +1,304 @@
+import json
+import os
+import numpy as np
+from tools import *
+from players import PlayerAB
+from tracing import *
+
+# Columns of the tables of records: name, dtype and number of values per row
+GAME_COLUMNS = [
+    ("game", "i8", 1),
+    ("player_A", "i1", 1),  # code of the class of the player, see the "players" entry of the schema
+    ("player_B", "i1", 1),
+    ("alpha_A", "f4", 1),   # nan for the players which are not PlayerAB
+    ("beta_A", "f4", 1),
+    ("alpha_B", "f4", 1),
+    ("beta_B", "f4", 1),
+    ("n_turns", "i2", 1),
+    ("score_A", "i2", 1),
+    ("score_B", "i2", 1),
+]
+TURN_COLUMNS = [
+    ("game", "i8", 1),
+    ("turn", "i2", 1),
+    ("side", "i1", 1),      # 0 for player A, 1 for player B
+    ("C", "f4", 1),
+    ("n_throws", "i1", 1),
+    ("choices", "i1", 1),   # bit array of the faces kept
+    ("kept", "i1", N_FACES), # number of dice kept of each face
+    ("score", "i2", 1),     # 0 if the turn is failed
+    ("failed", "?", 1),
+    ("action", "i1", 1),    # TAKE, STEAL, LOSE or LOSE_TURN
+    ("domino", "i1", 1),    # domino taken, stolen or lost, 0 for LOSE_TURN
+]
+
+
+class ColumnWriter:
+    """Appends rows to a table stored as one raw binary file per column, written by chunks.
+
+    Each column of the table is the file <path>/<column>.bin, holding the values of the rows one after the other
+    in the dtype of the column. The rows are buffered in arrays of chunk_size rows and appended to the files
+    when the buffer is full, so writing does not depend on the number of rows already written.
+
+    :param path: directory of the table, created if needed
+    :type path: str
+    :param columns: (name, dtype, number of values per row) of each column
+    :type columns: list
+    :param chunk_size: number of rows buffered
+    :type chunk_size: int
+    """
+
+    def __init__(self, path: str, columns: list, chunk_size: int = 65536) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.files = {name: open(os.path.join(path, f"{name}.bin"), "ab") for name, _, _ in columns}
+        self.buffers = {name: np.zeros((chunk_size, width) if width > 1 else chunk_size, dtype=dtype) for name, dtype, width in columns}
+        self.n = 0
+        self.rows = 0
+
+    def append(self, **values) -> None:
+        """Adds a row, the columns not given being 0"""
+        for name, buffer in self.buffers.items():
+            buffer[self.n] = values.get(name, 0)
+        self.n += 1
+        self.rows += 1
+        if self.n == self.chunk_size:
+            self.flush()
+
+    def extend(self, **values) -> None:
+        """Adds several rows given as arrays, the columns not given being 0"""
+        n = len(next(iter(values.values())))
+        start = 0
+        while start < n:
+            size = min(n - start, self.chunk_size - self.n)
+            for name, buffer in self.buffers.items():
+                buffer[self.n:self.n + size] = values[name][start:start + size] if name in values else 0
+            self.n += size
+            self.rows += size
+            start += size
+            if self.n == self.chunk_size:
+                self.flush()
+
+    def flush(self) -> None:
+        for name, buffer in self.buffers.items():
+            self.files[name].write(buffer[:self.n].tobytes())
+            self.files[name].flush()
+        self.n = 0
+
+    def close(self) -> None:
+        self.flush()
+        for file in self.files.values():
+            file.close()
+
+
+class ColumnReader:
+    """Table written by ColumnWriter, read column by column as memory maps.
+
+    The number of rows is the one of the shortest column, so a table being written can be read.
+
+    :param path: directory of the table
+    :type path: str
+    :param columns: (name, dtype, number of values per row) of each column
+    :type columns: list
+    """
+
+    def __init__(self, path: str, columns: list) -> None:
+        self.path = path
+        self.columns = {name: (np.dtype(dtype), width) for name, dtype, width in columns}
+        sizes = [os.path.getsize(self.filename(name))//(dtype.itemsize*width) for name, (dtype, width) in self.columns.items()]
+        self.n = min(sizes) if sizes else 0
+        self._maps = {}
+
+    def filename(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """Returns a column as a read-only memory map, of shape (n,) or (n, width)"""
+        if name not in self._maps:
+            dtype, width = self.columns[name]
+            if self.n == 0:
+                self._maps[name] = np.zeros((0, width) if width > 1 else 0, dtype=dtype)
+            else:
+                self._maps[name] = np.memmap(self.filename(name), dtype=dtype, mode="r", shape=(self.n, width) if width > 1 else (self.n,))
+        return self._maps[name]
+
+    def chunks(self, names: list, chunk_size: int = 1 << 20):
+        """Iterates over the rows by chunks, yielding a dict of arrays per chunk"""
+        for start in range(0, self.n, chunk_size):
+            yield {name: np.asarray(self[name][start:start + chunk_size]) for name in names}
+
+
+class GameRecorder:
+    """Streams turn-level and game-level records of the games to a directory of columnar tables.
+
+    The recorder is a sink of the tracer: the turns are built from the events of the game (TURN, DICE, CHOICE,
+    STOP or FAIL, then TAKE, STEAL, LOSE or LOSE_TURN). The game-level records are added by end_game, or by
+    add_games for games played by BatchGame, which are not traced. The directory holds the tables turns/ and
+    games/ (see ColumnWriter) and schema.json, describing the columns and the codes of the players.
+
+        recorder = GameRecorder("records")
+        record_games(game, 1000, recorder)
+        recorder.close()
+        games = RecordReader("records").games
+
+    :param path: directory of the records, new records are appended to the existing ones
+    :type path: str
+    :param chunk_size: number of rows buffered per table
+    :type chunk_size: int
+    """
+
+    def __init__(self, path: str, chunk_size: int = 65536) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        schema = read_schema(path)
+        self.players = schema["players"]
+        self.turns = ColumnWriter(os.path.join(path, "turns"), TURN_COLUMNS, chunk_size)
+        self.games = ColumnWriter(os.path.join(path, "games"), GAME_COLUMNS, chunk_size)
+        self.game_id = len(ColumnReader(os.path.join(path, "games"), GAME_COLUMNS))
+        self.n_turns = 0
+        self.side = 0
+        self.turn = None
+        self.dice = None
+
+    def player_code(self, player) -> int:
+        name = type(player).__name__
+        if name not in self.players:
+            self.players.append(name)
+        return self.players.index(name)
+
+    def write(self, record: tuple) -> None:
+        event = record[0]
+        if event == PLAYS:
+            self.side = int(record[1])
+        elif event == TURN:
+            self.turn = {"game": self.game_id, "turn": self.n_turns, "side": self.side, "C": record[1], "n_throws": 0,
+                         "choices": 0, "kept": np.zeros(N_FACES, dtype=np.int8), "score": 0, "failed": False}
+            self.n_turns += 1
+        elif self.turn is None:
+            return
+        elif event == DICE:
+            self.turn["n_throws"] += 1
+            self.dice = record[1:]
+        elif event == CHOICE:
+            face = int(record[1])
+            self.turn["choices"] |= 1 << face
+            self.turn["kept"][face] = self.dice[face]
+        elif event == STOP:
+            self.turn["score"] = record[1]
+        elif event == FAIL:
+            self.turn["failed"] = True
+        elif event in (TAKE, STEAL, LOSE, LOSE_TURN):
+            self.turns.append(**self.turn, action=event, domino=record[1] if len(record) > 1 else 0)
+            self.turn = None
+
+    def begin_game(self) -> None:
+        self.n_turns = 0
+        self.side = 0
+        self.turn = None
+
+    def end_game(self, game) -> None:
+        """Adds the game-level record of a Game which has been played"""
+        params = []
+        for player in (game.playerA, game.playerB):
+            params += [getattr(player, "alpha", np.nan), getattr(player, "beta", np.nan)]
+        self.games.append(game=self.game_id, player_A=self.player_code(game.playerA), player_B=self.player_code(game.playerB),
+                          alpha_A=params[0], beta_A=params[1], alpha_B=params[2], beta_B=params[3], n_turns=self.n_turns,
+                          score_A=game.score('A'), score_B=game.score('B'))
+        self.game_id += 1
+
+    def add_games(self, batch) -> None:
+        """Adds the game-level records of all the games of a BatchGame which has been played (without turns)"""
+        n = batch.n_games
+        scores = batch.score()
+        code = self.player_code(PlayerAB())
+        self.games.extend(game=np.arange(self.game_id, self.game_id + n), player_A=np.full(n, code), player_B=np.full(n, code),
+                          alpha_A=batch.alphas[:, 0], beta_A=batch.betas[:, 0], alpha_B=batch.alphas[:, 1], beta_B=batch.betas[:, 1],
+                          n_turns=np.full(n, -1), score_A=scores[:, 0], score_B=scores[:, 1])
+        self.game_id += n
+
+    def flush(self) -> None:
+        self.turns.flush()
+        self.games.flush()
+        with open(os.path.join(self.path, "schema.json"), "w") as file:
+            json.dump({"games": GAME_COLUMNS, "turns": TURN_COLUMNS, "players": self.players}, file)
+
+    def close(self) -> None:
+        self.flush()
+        self.turns.close()
+        self.games.close()
+
+
+def read_schema(path: str) -> dict:
+    try:
+        with open(os.path.join(path, "schema.json")) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"games": GAME_COLUMNS, "turns": TURN_COLUMNS, "players": []}
+
+
+class RecordReader:
+    """Records written by GameRecorder, the columns being memory maps
+
+    :param path: directory of the records
+    :type path: str
+    """
+
+    def __init__(self, path: str) -> None:
+        schema = read_schema(path)
+        self.players = schema["players"]
+        self.games = ColumnReader(os.path.join(path, "games"), schema["games"])
+        self.turns = ColumnReader(os.path.join(path, "turns"), schema["turns"])
+
+
+def record_games(game, n_games: int, recorder: GameRecorder) -> None:
+    """Plays n_games games of a Game and records them, the tracer being sent to the recorder while playing"""
+    sink = TRACER.sink if TRACER.enabled else None
+    TRACER.enable(recorder)
+    try:
+        for _ in range(n_games):
+            game.reinit()
+            recorder.begin_game()
+            game.play_game(display=False)
+            recorder.end_game(game)
+    finally:
+        TRACER.enabled = False
+        TRACER.sink = None
+        if sink is not None:
+            TRACER.enable(sink)
+
+
+if __name__ == "__main__":
+
+    import shutil
+    import time
+    from game import Game
+    from batch import BatchGame
+
+    path = "records"
+    rules = dict(N_dice=4, domino_min=11, domino_max=18, r=[1, 1, 2, 2, 3, 3, 4, 4])
+    shutil.rmtree(path, ignore_errors=True)
+    recorder = GameRecorder(path)
+    tic = time.time()
+    record_games(Game(PlayerAB(**rules), PlayerAB(**rules), dice=DiceSource(0), **rules), 1000, recorder)
+    for seed in range(10):
+        alphas = np.column_stack((np.random.default_rng(seed).uniform(0, 4, 10000), np.ones(10000)))
+        batch = BatchGame(10000, alphas=alphas, dice=DiceSource(seed), **rules)
+        batch.play_game()
+        recorder.add_games(batch)
+    recorder.close()
+    print(f"recorded in {time.time() - tic:.1f}s")
+
+    tic = time.time()
+    reader = RecordReader(path)
+    games = reader.games
+    wins = np.asarray(games["score_A"]) > np.asarray(games["score_B"])
+    bins = np.digitize(games["alpha_A"], np.arange(0.5, 4, 0.5))
+    print(f"{len(games)} games, {len(reader.turns)} turns read in {time.time() - tic:.2f}s")
+    for i, rate in enumerate(np.bincount(bins, wins)/np.maximum(np.bincount(bins), 1)):
+        print(f"alpha in [{0.5*i:.1f}, {0.5*(i + 1):.1f}): win rate of A {rate:.3f}")
+    turns = reader.turns
+    print(f"failed turns: {np.mean(turns['failed']):.3f}, mean throws: {np.mean(turns['n_throws']):.2f}, steals: {np.mean(turns['action'] == STEAL):.3f}")
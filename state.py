@@ -0,0 +1,158 @@
+MAX_DOMINOS = 16
+
+
+class GameState:
+    """Compact state of a game: the grill as a bit mask and both stacks in a fixed-capacity byte array.
+
+    Bit i of the grill is set when the domino domino_min + i is still on the grill. The stack of side s
+    (0 for player A, 1 for player B) is stacks[s*MAX_DOMINOS : s*MAX_DOMINOS + heights[s]], bottom first,
+    the free slots being 0. A state is copied, compared and hashed without any conversion, and serialized
+    in 3 + 2*MAX_DOMINOS bytes.
+
+    :param n_dominos: number of dominos of the game, at most MAX_DOMINOS
+    :type n_dominos: int
+    :param grill: bit mask of the dominos available, defaults to all the dominos
+    :type grill: int, optional
+    """
+
+    __slots__ = ("grill", "n_dominos", "stacks", "heights")
+
+    def __init__(self, n_dominos: int = 16, grill: int = None) -> None:
+        if n_dominos > MAX_DOMINOS:
+            raise ValueError(f"a GameState holds at most {MAX_DOMINOS} dominos")
+        self.n_dominos = n_dominos
+        self.grill = (1 << n_dominos) - 1 if grill is None else grill
+        self.stacks = bytearray(2*MAX_DOMINOS)
+        self.heights = bytearray(2)
+
+    def copy(self) -> "GameState":
+        state = GameState.__new__(GameState)
+        state.n_dominos = self.n_dominos
+        state.grill = self.grill
+        state.stacks = self.stacks[:]
+        state.heights = self.heights[:]
+        return(state)
+
+    def restore(self, other: "GameState") -> None:
+        """Puts this state back in the position of other, without allocating"""
+        self.n_dominos = other.n_dominos
+        self.grill = other.grill
+        self.stacks[:] = other.stacks
+        self.heights[:] = other.heights
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, GameState):
+            return NotImplemented
+        return(self.grill == other.grill and self.n_dominos == other.n_dominos
+               and self.heights == other.heights and self.stacks == other.stacks)
+
+    def __hash__(self) -> int:
+        return(hash((self.grill, self.n_dominos, bytes(self.heights), bytes(self.stacks))))
+
+    def __repr__(self) -> str:
+        grill = ''.join("X" if (self.grill >> i) & 1 else "." for i in range(self.n_dominos))
+        return f"GameState(grill={grill}, A={self.dominos(0)}, B={self.dominos(1)})"
+
+    def to_bytes(self) -> bytes:
+        """Serializes the state: n_dominos, grill (2 bytes, little endian), heights and stacks"""
+        return(bytes((self.n_dominos,)) + self.grill.to_bytes(2, "little") + bytes(self.heights) + bytes(self.stacks))
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "GameState":
+        state = GameState(data[0], int.from_bytes(data[1:3], "little"))
+        state.heights[:] = data[3:5]
+        state.stacks[:] = data[5:5 + 2*MAX_DOMINOS]
+        return(state)
+
+    def over(self) -> bool:
+        return(self.grill == 0)
+
+    def available(self, i: int) -> bool:
+        """Returns True if the i-th domino of the grill (domino_min + i) is available"""
+        return(bool((self.grill >> i) & 1))
+
+    def grill_list(self) -> list:
+        """Returns the grill as in Game, a list of bools"""
+        return([bool((self.grill >> i) & 1) for i in range(self.n_dominos)])
+
+    def dominos(self, side: int) -> list:
+        """Returns the stack of the given side as in Player.dominos, top last"""
+        start = side*MAX_DOMINOS
+        return(list(self.stacks[start:start + self.heights[side]]))
+
+    def top(self, side: int) -> int:
+        """Returns the domino on the top of the stack of the given side, 0 if the stack is empty"""
+        height = self.heights[side]
+        return(self.stacks[side*MAX_DOMINOS + height - 1] if height else 0)
+
+    def push(self, side: int, domino: int) -> None:
+        self.stacks[side*MAX_DOMINOS + self.heights[side]] = domino
+        self.heights[side] += 1
+
+    def pop(self, side: int) -> int:
+        self.heights[side] -= 1
+        i = side*MAX_DOMINOS + self.heights[side]
+        domino = self.stacks[i]
+        self.stacks[i] = 0
+        return(domino)
+
+    def take(self, i: int) -> None:
+        """Removes the i-th domino from the grill"""
+        self.grill &= ~(1 << i)
+
+    @staticmethod
+    def from_game(game) -> "GameState":
+        """Builds the compact state of a Game"""
+        state = GameState(len(game.grill), sum(1 << i for i, available in enumerate(game.grill) if available))
+        for side, player in enumerate((game.playerA, game.playerB)):
+            state.heights[side] = len(player.dominos)
+            state.stacks[side*MAX_DOMINOS:side*MAX_DOMINOS + len(player.dominos)] = bytes(player.dominos)
+        return(state)
+
+    def to_game(self, game) -> None:
+        """Puts a Game and its players in this position, the players being reset as between two turns (Player.restore)"""
+        game.grill = self.grill_list()
+        game.playerA.restore(game.grill, self.dominos(0))
+        game.playerB.restore(game.grill, self.dominos(1))
+
+    def play_turn(self, game, side: int) -> int:
+        """Plays a turn of the given side from this state with the rules and the players of game (Game.play_turn)
+
+        The game is put in this state, the turn is played by Game.play_turn and the resulting position is
+        stored back in this state.
+
+        :param game: game providing the rules and the players
+        :type game: Game
+        :param side: playing side, 0 for player A and 1 for player B
+        :type side: int
+        :return: reward of the playing player
+        :rtype: int
+        """
+        self.to_game(game)
+        players = (game.playerA, game.playerB)
+        reward = game.play_turn(players[side], players[1 - side])
+        self.restore(GameState.from_game(game))
+        return(reward)
+
+
+if __name__ == "__main__":
+
+    from game import Game
+    from players import PlayerAB
+    from tools import DiceSource
+
+    # A position restored after some turns gives the players the r and C of a game started from it
+    game = Game(PlayerAB(), PlayerAB(), dice=DiceSource(0))
+    game.reinit()
+    start = game.snapshot()
+    players = (game.playerA, game.playerB)
+    for turn in range(6):
+        game.play_turn(players[turn % 2], players[1 - turn % 2])
+    middle = game.snapshot()
+    game.restore(start)
+    assert all(game.grill) and game.playerA.r == game.playerA.basic_r and game.playerB.r == game.playerB.basic_r
+    assert game.playerA.C == 0 and game.playerA.table is None
+    game.restore(middle)
+    assert game.playerA.r == [reward if available else 0 for reward, available in zip(game.playerA.basic_r, game.grill)]
+    assert game.snapshot() == middle
+    print("restore: ok")
@@ -0,0 +1,764 @@
+import functools
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Tuple
+from tools import *
+
+
+N_CHOICES = 1 << N_FACES
+
+
+class TurnLayer:
+    """Reachable states of a turn with n available dice and their transitions for every face and dice output.
+
+    Forbidden transitions point to the sentinel index -1, whose value is -inf.
+
+    :param states: flat indices of the states in the value table, shape (R,)
+    :param successors: flat indices of the states reached by keeping each face, shape (N_FACES, R, M)
+    :param stop_scores: scores reached by keeping each face if the player is allowed to stop there, shape (N_FACES, R, M)
+    :param probas: probabilities of the dice outputs, shape (M,)
+    """
+
+    def __init__(self, states, successors, stop_scores, probas) -> None:
+        self.states = states
+        self.successors = successors
+        self.stop_scores = stop_scores
+        self.probas = probas
+
+    def compress(self, sentinel: int) -> None:
+        """Merges the dice outputs of each state which lead to the same compact successors for every face.
+
+        Once some faces have been kept, many dice outputs only differ by the number of dice of these faces and
+        have the same transitions: they are merged into a single column whose probability is the sum of theirs.
+        The forbidden transitions (compact index sentinel) are dropped. With 8 dice, the solvers then gather
+        about a fifth of the transitions of compact_successors.
+
+        :param sentinel: compact index of the forbidden transitions
+        :type sentinel: int
+        """
+        L, M = self.compact_successors.shape[1:]
+        rows = np.ascontiguousarray(np.concatenate((np.repeat(np.arange(L), M)[:, None], self.compact_successors.transpose(1, 2, 0).reshape(L*M, N_FACES)), axis=1))
+        # Rows are compared as raw bytes, which is much faster than np.unique(axis=0), then sorted by state
+        _, first, inverse = np.unique(rows.view(np.dtype((np.void, rows.itemsize*rows.shape[1]))).ravel(), return_index=True, return_inverse=True)
+        order = np.argsort(rows[first, 0], kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        columns = rows[first[order]]
+        self.sentinel = sentinel
+        self.column_rows = columns[:, 0] # row of the state of each column, sorted
+        self.column_successors = columns[:, 1:]
+        self.column_probas = np.bincount(rank[inverse], np.tile(self.probas, L), minlength=len(columns))
+        self.column_widths = (self.column_successors != sentinel).sum(axis=1)
+        self.transitions = self.restrict()
+
+    def restrict(self, rows: np.ndarray = None) -> list:
+        """Returns the merged transitions of some states of the layer, grouped by number of allowed faces.
+
+        Within a group, the columns are sorted by state, so the values of the states are sums over contiguous
+        columns (see layer_values).
+
+        :param rows: positions of the states in the layer, all the states if None
+        :type rows: np.ndarray, optional
+        :return: (successors (width, U), probabilities (U,), first column of each state (S,), rows of the states (S,)) of each group
+        :rtype: list
+        """
+        selected = np.ones(len(self.column_rows), dtype=bool) if rows is None else np.isin(self.column_rows, rows)
+        res = []
+        for width in range(1, N_FACES + 1):
+            columns = np.flatnonzero(selected & (self.column_widths == width))
+            if not len(columns):
+                continue
+            successors = self.column_successors[columns]
+            successors = successors[successors != self.sentinel].reshape(len(columns), width).T
+            state_rows, starts = np.unique(self.column_rows[columns], return_index=True)
+            res.append((np.ascontiguousarray(successors), self.column_probas[columns], starts, state_rows))
+        return res
+
+
+def layer_values(reach: np.ndarray, transitions: list, n_rows: int) -> np.ndarray:
+    """Computes the values of the states of a layer for K sets of terminal rewards, the kernel of the solvers
+
+    :param reach: reward of reaching each compact state (best of its value and of stopping there), shape (K, R+2)
+    :type reach: np.ndarray
+    :param transitions: merged transitions of the states, as returned by TurnLayer.restrict
+    :type transitions: list
+    :param n_rows: number of states of the layer
+    :type n_rows: int
+    :return: values of the states of the layer, 0 for the states without transitions, shape (K, n_rows)
+    :rtype: np.ndarray
+    """
+    values = np.zeros((len(reach), n_rows))
+    for successors, probas, starts, rows in transitions:
+        best = np.take(reach, successors, axis=1).max(axis=1)
+        best *= probas
+        values[:, rows] += np.add.reduceat(best, starts, axis=1)
+    return(values)
+
+
+class TurnGraph:
+    """Reachable states of a turn with N_dice dice and their transitions.
+
+    States are identified by their flat index in the value table of shape (N_CHOICES, N_dice + 1, 5*N_dice + 1)
+    indexed by (choices, nb_available_dice, score). The graph is explored forward from (0, N_dice, 0).
+
+    :param N_dice: number of dice
+    :type N_dice: int
+    """
+
+    def __init__(self, N_dice: int) -> None:
+        self.N_dice = N_dice
+        self.shape = (N_CHOICES, N_dice + 1, 5*N_dice + 1)
+        self.size = N_CHOICES*(N_dice + 1)*(5*N_dice + 1)
+        faces = np.arange(N_FACES)[:, None, None]
+        reached = {N_dice: [np.array([np.ravel_multi_index((0, N_dice, 0), self.shape)])]}
+        self.layers = {}
+        for n in range(N_dice, 0, -1):
+            states = np.unique(np.concatenate(reached.get(n, [np.zeros(0, dtype=np.int64)])))
+            choices, _, scores = np.unravel_index(states, self.shape)
+            index = dice_index(n)
+            counts = index.outputs.T[:, None, :]
+            new_choices = choices[None, :, None] | (1 << faces)
+            new_scores = scores[None, :, None] + index.scores.T[:, None, :]
+            allowed = (counts > 0) & (((choices[None, :, None] >> faces) & 1) == 0)
+            successors = np.where(allowed, (new_choices*(N_dice + 1) + n - counts)*(5*N_dice + 1) + new_scores, -1)
+            for k in range(1, n + 1):
+                reached.setdefault(n - k, []).append(successors[allowed & (counts == k)])
+            stop_scores = np.where(allowed & (new_choices % 2 == 1), new_scores, -1)
+            self.layers[n] = TurnLayer(states, successors, stop_scores, index.probas)
+        # Position of each reachable state in the compact value vectors, -1 (a trailing nan) for the unreachable states
+        self.reachable = np.unique(np.concatenate([layer.states for layer in self.layers.values()] + reached[0]))
+        self.compact = np.full(self.size, -1, dtype=np.int64)
+        self.compact[self.reachable] = np.arange(len(self.reachable))
+        # Transitions between compact positions, used by solve_batch: forbidden transitions point to a -inf at
+        # position R and, when no face can be kept, face 0 points to the reward of a failed turn at position R + 1
+        R = len(self.reachable)
+        self.compact_start = self.compact[np.ravel_multi_index((0, N_dice, 0), self.shape)]
+        self.compact_failed = self.compact[self.reachable[np.unravel_index(self.reachable, self.shape)[1] == 0]]
+        for layer in self.layers.values():
+            layer.compact_states = self.compact[layer.states]
+            successors = np.where(layer.successors >= 0, self.compact[layer.successors], R)
+            successors[0][(layer.successors < 0).all(axis=0)] = R + 1
+            layer.compact_successors = successors
+            layer.compress(R)
+        # Score of the stop allowed in each compact state when it is reached by keeping a face, -1 if stopping is not
+        # allowed there: the stop reward of a transition only depends on the state reached (used by solve_batch)
+        self.compact_stop_scores = np.full(R + 2, -1, dtype=np.int64)
+        for layer in self.layers.values():
+            self.compact_stop_scores[layer.compact_successors] = layer.stop_scores
+        # Bit s of stop_masks[i] is set if stopping with score s can be reached from the compact state i: the value
+        # of the state only depends on these stop rewards and on the reward of a failed turn (used by solve_update)
+        self.stop_masks = None
+        if 5*N_dice + 1 <= 64:
+            self.stop_masks = np.zeros(R + 2, dtype=np.uint64)
+            # Number of merged transitions of each state, the cost of solving a state being proportional to it
+            self.costs = np.zeros(R + 2, dtype=np.int64)
+            for n in range(1, N_dice + 1):
+                layer = self.layers[n]
+                bits = np.where(layer.stop_scores >= 0, np.uint64(1) << np.maximum(layer.stop_scores, 0).astype(np.uint64), np.uint64(0))
+                masks = bits | self.stop_masks[layer.compact_successors]
+                self.stop_masks[layer.compact_states] = np.bitwise_or.reduce(masks, axis=(0, 2))
+                self.costs[layer.compact_states] = np.bincount(layer.column_rows, layer.column_widths, minlength=len(layer.states))
+
+
+@functools.cache
+def turn_graph(N_dice: int) -> TurnGraph:
+    """Returns the graph of a turn with N_dice dice, built once per number of dice"""
+    return(TurnGraph(N_dice))
+
+
+def solve(N_dice: int, fail_reward: float, stop_rewards: tuple) -> np.ndarray:
+    """Solves the Bellman equation of a turn bottom-up over the (choices, nb_available_dice, score) state space.
+
+    The layers are solved by increasing number of available dice since every choice uses at least one die.
+    For each layer, all the reachable states, dice outputs and choices are processed at once using the
+    transitions precomputed in the turn graph (see solve_batch, which gives the same values).
+
+    :param N_dice: number of dice
+    :type N_dice: int
+    :param fail_reward: reward when the turn is failed
+    :type fail_reward: float
+    :param stop_rewards: reward obtained by stopping with a given score (index of the tuple)
+    :type stop_rewards: tuple
+    :return: expected rewards indexed by (choices, nb_available_dice, score), unreachable states are nan
+    :rtype: np.ndarray
+    """
+    graph = turn_graph(N_dice)
+    values = np.full(graph.size, np.nan)
+    values[graph.reachable] = solve_batch(N_dice, [fail_reward], [stop_rewards])[0]
+    return(values.reshape(graph.shape))
+
+
+def solve_batch(N_dice: int, fail_rewards: np.ndarray, stop_rewards: np.ndarray, chunk_size: int = 16) -> np.ndarray:
+    """Solves the Bellman equation of a turn for K sets of terminal rewards at once (see solve).
+
+    The values of the K sets are stored side by side in compact form, so every layer of the turn graph is
+    processed once per chunk of sets. The memory used is about chunk_size times the size of the largest
+    layer of the turn graph.
+
+    :param N_dice: number of dice
+    :type N_dice: int
+    :param fail_rewards: reward when the turn is failed, shape (K,)
+    :type fail_rewards: np.ndarray
+    :param stop_rewards: reward obtained by stopping with each score, shape (K, 5*N_dice+1)
+    :type stop_rewards: np.ndarray
+    :param chunk_size: number of sets solved together
+    :type chunk_size: int
+    :return: expected rewards of the reachable states (in the order of graph.reachable), shape (K, R)
+    :rtype: np.ndarray
+    """
+    graph = turn_graph(N_dice)
+    R = len(graph.reachable)
+    fail_rewards = np.asarray(fail_rewards, dtype=np.float64)
+    stop_rewards = np.asarray(stop_rewards, dtype=np.float64)
+    res = np.empty((len(fail_rewards), R))
+    for start in range(0, len(fail_rewards), chunk_size):
+        fail = fail_rewards[start:start + chunk_size]
+        K = len(fail)
+        stop = np.concatenate((stop_rewards[start:start + chunk_size], np.full((K, 1), -np.inf)), axis=1)
+        values = np.empty((K, R + 2))
+        values[:, R] = -np.inf
+        values[:, R + 1] = fail
+        values[:, graph.compact_failed] = fail[:, None]
+        # Reward of reaching each state by keeping a face, the best of its value and of stopping there, so a
+        # layer gathers a single array
+        reach = np.maximum(values, np.take(stop, graph.compact_stop_scores, axis=1))
+        for n in range(1, N_dice + 1):
+            layer = graph.layers[n]
+            values[:, layer.compact_states] = layer_values(reach, layer.transitions, len(layer.states))
+            reach[:, layer.compact_states] = np.maximum(values[:, layer.compact_states], np.take(stop, graph.compact_stop_scores[layer.compact_states], axis=1))
+        res[start:start + chunk_size] = values[:, :R]
+    return(res)
+
+
+def solve_update(base: "StrategyTable", stop_rewards: np.ndarray, max_fraction: float = 0.8, chunk_size: int = 32) -> Tuple[np.ndarray, int]:
+    """Solves turns whose stop rewards differ from the ones of an already solved table in a few scores.
+
+    Only the states from which stopping with one of the changed scores is reachable are solved again, layer by
+    layer, the others keep the values of the base table. The cost is proportional to the number of states
+    depending on the changed rewards instead of the size of the turn graph. Several sets of stop rewards can be
+    given at once, they are then solved side by side along a last axis. The reward of a failed turn must be
+    the same as the one of the base table.
+
+    :param base: solved table of the same number of dice and the same reward of a failed turn
+    :type base: StrategyTable
+    :param stop_rewards: reward obtained by stopping with each score, shape (5*N_dice+1,) or (K, 5*N_dice+1)
+    :type stop_rewards: np.ndarray
+    :param max_fraction: fraction of the work of a full solve (merged transitions of the states) above which the update is given up
+    :type max_fraction: float
+    :param chunk_size: number of sets of stop rewards solved together
+    :type chunk_size: int
+    :return: compact values of the new tables, shape (R+1,) or (K, R+1) (None if given up), number of states depending on the changed rewards
+    :rtype: Tuple[np.ndarray, int]
+    """
+    graph = base.graph
+    R = len(graph.reachable)
+    stop_rewards = np.asarray(stop_rewards, dtype=np.float64)
+    single = stop_rewards.ndim == 1
+    stop_rewards = np.atleast_2d(stop_rewards)
+    changed = np.flatnonzero((stop_rewards != np.asarray(base.stop_rewards, dtype=np.float64)).any(axis=0)).astype(np.uint64)
+    affected = (graph.stop_masks & np.bitwise_or.reduce(np.uint64(1) << changed, initial=np.uint64(0))) != 0
+    n_states = int(np.count_nonzero(affected))
+    if graph.costs[affected].sum() > max_fraction*graph.costs.sum():
+        return(None, n_states)
+    rows = {n: np.flatnonzero(affected[layer.compact_states]) for n, layer in graph.layers.items()}
+    transitions = {n: graph.layers[n].restrict(rows[n]) for n in rows if len(rows[n])}
+    res = np.empty((len(stop_rewards), R + 1))
+    res[:, R] = np.nan
+    for start in range(0, len(stop_rewards), chunk_size):
+        K = len(stop_rewards[start:start + chunk_size])
+        stop = np.concatenate((stop_rewards[start:start + chunk_size], np.full((K, 1), -np.inf)), axis=1)
+        values = np.empty((K, R + 2))
+        values[:, :R] = base.compact_values[:R]
+        values[:, R] = -np.inf
+        values[:, R + 1] = base.fail_reward
+        reach = np.maximum(values, np.take(stop, graph.compact_stop_scores, axis=1))
+        for n in range(1, base.N_dice + 1):
+            if n not in transitions:
+                continue
+            states = graph.layers[n].compact_states[rows[n]]
+            values[:, states] = layer_values(reach, transitions[n], len(graph.layers[n].states))[:, rows[n]]
+            reach[:, states] = np.maximum(values[:, states], np.take(stop, graph.compact_stop_scores[states], axis=1))
+        res[start:start + chunk_size, :R] = values[:, :R]
+    return(res[0] if single else res, n_states)
+
+
+class StrategyTable:
+    """Solution of the Bellman equation of a turn for a given set of terminal rewards.
+
+    The solution of a turn only depends on the number of dice, on the reward obtained when the turn
+    is failed and on the reward obtained by stopping with each score once a worm has been chosen.
+    Those rewards sum up C, r, adv and the domino range of a player.
+
+    :param N_dice: number of dice
+    :type N_dice: int
+    :param fail_reward: reward when the turn is failed (-C)
+    :type fail_reward: float
+    :param stop_rewards: reward obtained by stopping with a given score (index of the tuple)
+    :type stop_rewards: tuple
+    """
+
+    def __init__(self, N_dice: int, fail_reward: float, stop_rewards: tuple, compact_values: np.ndarray = None) -> None:
+        self.N_dice = N_dice
+        self.fail_reward = fail_reward
+        self.stop_rewards = stop_rewards
+        self.graph = turn_graph(N_dice)
+        # Only the values of the reachable states are kept
+        if compact_values is None:
+            compact_values = np.append(solve(N_dice, fail_reward, stop_rewards).reshape(-1)[self.graph.reachable], np.nan)
+        self.compact_values = compact_values
+        self._policy = None
+        self._distributions = {}
+        self._off_graph = {}
+
+    def value(self, choices: int, nb_available_dice: int, score: int) -> float:
+        """Returns the value of a state of the turn
+
+        The states which can not be reached from the beginning of a turn are not in the turn graph: they are solved
+        on demand by the Bellman recursion over their dice outputs, and cached.
+
+        :raises ValueError: if the state is out of the range of the turn (more dice than N_dice, or a score which
+            could exceed 5*N_dice)
+        """
+        compact = self.graph.compact[(choices*(self.N_dice + 1) + nb_available_dice)*(5*self.N_dice + 1) + score]
+        if compact >= 0:
+            return(self.compact_values[compact])
+        if not (0 <= choices < N_CHOICES and 0 <= nb_available_dice <= self.N_dice and 0 <= score and score + 5*nb_available_dice <= 5*self.N_dice):
+            raise ValueError(f"state {(choices, nb_available_dice, score)} out of the range of a turn with {self.N_dice} dice")
+        key = (choices, nb_available_dice, score)
+        if key not in self._off_graph:
+            self._off_graph[key] = sum(proba(dice_output, nb_available_dice)*self.strategy(dice_output, choices, nb_available_dice, score)[1]
+                                       for dice_output in all_possible_dice_outputs(nb_available_dice))
+        return(self._off_graph[key])
+
+    def expectancy(self, choices: int, nb_available_dice: int, score: int) -> float:
+        """Returns the expected reward with the given situation
+
+        :param choices: bit array of chosen dice
+        :type choices: int
+        :param nb_available_dice: number of available dice
+        :type nb_available_dice: int
+        :param score: score already achieved
+        :type score: int
+        :return: expected reward
+        :rtype: float
+        """
+        return(float(self.value(choices, nb_available_dice, score)))
+
+    def strategy(self, dice_results: tuple, previous_choices: int, nb_available_dice: int, score: int) -> Tuple[Tuple[int, int], int]:
+        """Computes the optimal strategy using Bellman equation.
+
+        :param dice_results: Results of the dice given in counting format
+        :type dice_results: tuple
+        :param previous_choices: Previous choices made by the player encoded by the indicative function given by the bits of the int
+        :type previous_choices: int
+        :param nb_available_dice: Number of dice available
+        :type nb_available_dice: int
+        :param score: Current score before taking an action
+        :type score: int
+        :return: (choice, expectancy).  choice = (chosen dice, 0 if player stops or 1 otherwise)
+        :rtype: Tuple[Tuple[int, int], int]
+        """
+        reward_temp = float('-inf')
+        choice_temp = None
+        for choice, count in enumerate(dice_results):
+            if not count or (previous_choices >> choice) & 1:
+                continue
+            new_choices = previous_choices | (1 << choice)
+            new_score = score + FACE_VALUES[choice]*count
+            expected_reward_continuing = self.value(new_choices, nb_available_dice - count, new_score)
+            if new_choices % 2 == 1 and self.stop_rewards[new_score] >= expected_reward_continuing: #The player should stop after chosing choice
+                reward = self.stop_rewards[new_score]
+                pchoice = (choice, 0)
+            else:
+                reward = float(expected_reward_continuing)
+                pchoice = (choice, 1)
+            if reward >= reward_temp:
+                reward_temp = reward
+                choice_temp = pchoice
+        if choice_temp is None:#the round is failed
+            return((None, self.fail_reward))
+        return(choice_temp, reward_temp)
+
+    def policy(self) -> dict:
+        """Computes the choice of strategy for every reachable state and dice output, once per table
+
+        :return: for each number of available dice, (face kept, True if the player stops, True if no face can be kept), each of shape (R, M)
+        :rtype: dict
+        """
+        if self._policy is None:
+            R = len(self.graph.reachable)
+            values = np.concatenate((self.compact_values[:R], [-np.inf, -np.inf]))
+            stop_rewards = np.append(np.asarray(self.stop_rewards, dtype=np.float64), -np.inf)
+            self._policy = {}
+            for n, layer in self.graph.layers.items():
+                forbidden = layer.successors < 0
+                continuing = values[layer.compact_successors]
+                stopping_reward = stop_rewards[layer.stop_scores]
+                stopping = stopping_reward >= continuing
+                reward = np.where(stopping, stopping_reward, continuing)
+                reward[forbidden] = -np.inf
+                # Same tie-breaking as strategy: the last best face is chosen
+                face = N_FACES - 1 - np.argmax(reward[::-1], axis=0)
+                stops = np.take_along_axis(stopping, face[None], axis=0)[0]
+                self._policy[n] = (face, stops, forbidden.all(axis=0))
+        return(self._policy)
+
+    def outcome_distribution(self, choices: int = 0, nb_available_dice: int = None, score: int = 0) -> np.ndarray:
+        """Computes the exact distribution of the result of the turn played with this strategy from the given situation.
+
+        The probability of each state is propagated forward through the turn graph, by decreasing number of
+        available dice, following the choices of strategy. Results are cached per starting situation.
+
+        :param choices: bit array of chosen dice
+        :type choices: int
+        :param nb_available_dice: number of available dice, defaults to N_dice
+        :type nb_available_dice: int, optional
+        :param score: score already achieved
+        :type score: int
+        :return: probability of stopping with each score 0 to 5*N_dice, then probability of failing the turn, shape (5*N_dice + 2,)
+        :rtype: np.ndarray
+        """
+        if nb_available_dice is None:
+            nb_available_dice = self.N_dice
+        key = (choices, nb_available_dice, score)
+        if key in self._distributions:
+            return(self._distributions[key])
+        graph = self.graph
+        start = graph.compact[(choices*(self.N_dice + 1) + nb_available_dice)*(5*self.N_dice + 1) + score]
+        if start < 0:
+            raise ValueError(f"{key} is not a reachable state of the turn")
+        n_scores = 5*self.N_dice + 1
+        res = np.zeros(n_scores + 1)
+        probas = np.zeros(len(graph.reachable))
+        probas[start] = 1
+        for n in range(nb_available_dice, 0, -1):
+            layer = graph.layers[n]
+            weights = probas[layer.compact_states][:, None]*layer.probas[None, :]
+            face, stops, failed = self.policy()[n]
+            successors = np.take_along_axis(layer.successors, face[None], axis=0)[0]
+            compact_successors = np.take_along_axis(layer.compact_successors, face[None], axis=0)[0]
+            res[-1] += weights[failed].sum()
+            stopped = stops & ~failed
+            res[:-1] += np.bincount(successors[stopped] % n_scores, weights[stopped], minlength=n_scores)
+            continued = ~stops & ~failed
+            probas += np.bincount(compact_successors[continued], weights[continued], minlength=len(probas))
+        # Continuing without any die left fails the turn
+        res[-1] += probas[graph.compact_failed].sum()
+        res.flags.writeable = False
+        self._distributions[key] = res
+        return(res)
+
+
+class DiskCache:
+    """Directory of solved strategy tables, one .npy file of compact values per key.
+
+    Tables are read as read-only memory maps, so all the processes using the same directory share the pages
+    of a table instead of each keeping a private copy. Files are written to a temporary file and renamed,
+    so concurrent processes never read a partial table.
+
+    Every table solved is written, and players with continuous (alpha, beta) almost never share a table (about
+    16 kB per table with 8 dice, so thousands of files for a few hundred games). The size of the directory is
+    therefore bounded: when it exceeds max_bytes, the least recently used files (by modification time, updated
+    when a table is read) are removed until it is under 90% of max_bytes. Removing a file does not affect the
+    processes which have it mapped.
+
+    :param path: directory of the tables, created if needed
+    :type path: str
+    :param max_bytes: maximal size of the directory
+    :type max_bytes: int
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1 << 28) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(path, exist_ok=True)
+        # Size of the directory as seen by this process, measured again when it exceeds max_bytes
+        self.size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.name.endswith(".npy"))
+
+    def filename(self, key: tuple) -> str:
+        N_dice, fail_reward, stop_rewards = key
+        digest = hashlib.sha1(np.array((fail_reward,) + tuple(stop_rewards), dtype=np.float64).tobytes()).hexdigest()
+        return(os.path.join(self.path, f"{N_dice}_{digest}.npy"))
+
+    def load(self, key: tuple) -> np.ndarray:
+        """Returns the compact values of the table of the key, None if the table is not in the directory"""
+        filename = self.filename(key)
+        try:
+            compact_values = np.load(filename, mmap_mode="r").view(np.ndarray)
+            os.utime(filename)
+        except FileNotFoundError:
+            return(None)
+        return(compact_values)
+
+    def save(self, key: tuple, compact_values: np.ndarray) -> np.ndarray:
+        """Writes the compact values of the table of the key and returns them mapped from the file"""
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            np.save(file, compact_values)
+        os.replace(tmp, self.filename(key))
+        self.size += os.path.getsize(self.filename(key))
+        if self.size > self.max_bytes:
+            self.evict()
+        return(self.load(key))
+
+    def evict(self) -> None:
+        """Removes the least recently used files until the directory is under 90% of max_bytes"""
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        self.size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.size <= 0.9*self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+
+class TableStore:
+    """Bounded LRU store of solved strategy tables, shared by all the players and all the games.
+
+    Tables are keyed on their parameters and not on the players, so players can be created and dropped
+    without keeping their tables alive.
+
+    The tables missing from the store are read from the disk cache if one is set, and the tables solved are
+    written to it, up to a size bound (see DiskCache). The disk cache is set by the environment variables
+    RL4PICKO_TABLE_CACHE (directory) and RL4PICKO_TABLE_CACHE_MB (size bound, 256 MB by default) or with
+    set_cache.
+
+    :param maxsize: maximum number of tables kept, the least recently used table is evicted first
+    :type maxsize: int
+    :param cache_dir: directory of the disk cache, none by default
+    :type cache_dir: str, optional
+    :param cache_bytes: maximal size of the disk cache
+    :type cache_bytes: int
+    """
+
+    def __init__(self, maxsize: int = 4096, cache_dir: str = None, cache_bytes: int = 1 << 28) -> None:
+        self._maxsize = maxsize
+        self._tables = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self.states_solved = 0
+        self.updates = 0
+        self.set_cache(cache_dir, cache_bytes)
+
+    def set_cache(self, cache_dir: str = None, max_bytes: int = 1 << 28) -> None:
+        """Sets the directory of the disk cache and its maximal size, None to disable it"""
+        self.cache = DiskCache(cache_dir, max_bytes) if cache_dir else None
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self._tables) > self._maxsize:
+            self._tables.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: tuple, base: StrategyTable = None) -> StrategyTable:
+        """Returns the table solving the turn for the given key, building it if needed
+
+        :param key: (N_dice, fail_reward, stop_rewards)
+        :type key: tuple
+        :param base: table solved for close rewards, the missing table is then solved by updating it when it has
+            the same number of dice and reward of a failed turn (solve_update)
+        :type base: StrategyTable, optional
+        :return: strategy table
+        :rtype: StrategyTable
+        """
+        table = self._lookup(key)
+        if table is None:
+            table = self._solve(key, base)
+            self._insert(key, table)
+        return table
+
+    def get_many(self, keys: list) -> list:
+        """Returns the tables of several keys, the missing tables being solved together.
+
+        The missing tables are grouped by number of dice, then by reward of a failed turn. The first table of
+        every group (one per reward of a failed turn, so one per alpha for PlayerAB) is solved by a single
+        solve_batch. The other tables of a group are solved from it at once by solve_update when their stop
+        rewards only differ in scores reachable from few states; the remaining ones are solved by a last
+        solve_batch.
+
+        Solving tables together does not make them nearly free: solve_batch still does a pass over the merged
+        transitions of the turn graph per table (see TurnLayer.compress), only faster than solve (about 0.14 ms
+        against 0.33 ms per table with 8 dice). The score changed by beta (the stolen domino) is reachable from
+        most states, and between two neighbouring betas of the grid of agent.py the values of the states making up
+        about 3/4 of the work change, so solve_update rarely applies and no pass can be shared. A 10x10 grid of
+        (alpha, beta) with 8 dice (100 distinct tables) takes about 15 ms, the time of about 45 single solves.
+
+        :param keys: keys (N_dice, fail_reward, stop_rewards), duplicates are looked up once
+        :type keys: list[tuple]
+        :return: strategy table of each key
+        :rtype: list[StrategyTable]
+        """
+        tables = {}
+        groups = {}
+        for key in dict.fromkeys(keys):
+            table = self._lookup(key)
+            if table is None:
+                groups.setdefault(key[0], {}).setdefault(key[1], []).append(key)
+            else:
+                tables[key] = table
+        for N_dice, by_fail in groups.items():
+            heads = [group[0] for group in by_fail.values()]
+            tables.update(zip(heads, self._solve_batch(N_dice, heads)))
+            remaining = []
+            for head, group in zip(heads, by_fail.values()):
+                if len(group) == 1:
+                    continue
+                base = tables[head]
+                compact_values = None
+                if base.graph.stop_masks is not None:
+                    compact_values, n_states = solve_update(base, np.array([key[2] for key in group[1:]], dtype=np.float64))
+                if compact_values is None:
+                    remaining += group[1:]
+                    continue
+                self.updates += len(group) - 1
+                self.states_solved += n_states*(len(group) - 1)
+                for key, values in zip(group[1:], compact_values):
+                    table = StrategyTable(*key, compact_values=values)
+                    self._insert(key, table)
+                    tables[key] = table
+            if remaining:
+                tables.update(zip(remaining, self._solve_batch(N_dice, remaining)))
+        return [tables[key] for key in keys]
+
+    def _solve_batch(self, N_dice: int, keys: list) -> list:
+        """Solves and stores the tables of keys of the same number of dice by solve_batch"""
+        if len(keys) == 1:
+            table = self._solve(keys[0])
+            self._insert(keys[0], table)
+            return [table]
+        compact_values = solve_batch(N_dice, np.array([key[1] for key in keys], dtype=np.float64),
+                                     np.array([key[2] for key in keys], dtype=np.float64))
+        self.states_solved += compact_values.size
+        res = []
+        for key, values in zip(keys, compact_values):
+            table = StrategyTable(*key, compact_values=np.append(values, np.nan))
+            self._insert(key, table)
+            res.append(table)
+        return res
+
+    def _lookup(self, key: tuple) -> StrategyTable:
+        """Returns the table of the key from the store or from the disk cache, None if it must be solved"""
+        table = self._tables.get(key)
+        if table is not None:
+            self.hits += 1
+            self._tables.move_to_end(key)
+            return table
+        self.misses += 1
+        compact_values = None if self.cache is None else self.cache.load(key)
+        if compact_values is None:
+            return None
+        self.disk_hits += 1
+        table = StrategyTable(*key, compact_values=compact_values)
+        self._tables[key] = table
+        self._evict()
+        return table
+
+    def _insert(self, key: tuple, table: StrategyTable) -> None:
+        if self.cache is not None:
+            table.compact_values = self.cache.save(key, table.compact_values)
+            self.disk_writes += 1
+        self._tables[key] = table
+        self._evict()
+
+    def _solve(self, key: tuple, base: StrategyTable = None) -> StrategyTable:
+        N_dice, fail_reward, stop_rewards = key
+        if base is not None and base.N_dice == N_dice and base.fail_reward == fail_reward and base.graph.stop_masks is not None:
+            compact_values, n_states = solve_update(base, stop_rewards)
+            if compact_values is not None:
+                self.updates += 1
+                self.states_solved += n_states
+                return StrategyTable(*key, compact_values=compact_values)
+        table = StrategyTable(*key)
+        self.states_solved += len(table.graph.reachable)
+        return table
+
+    def clear(self) -> None:
+        """Drops all the tables and resets the counters"""
+        self._tables.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self.states_solved = 0
+        self.updates = 0
+
+    def stats(self) -> dict:
+        """Returns the counters of the store
+
+        :return: hits, misses, evictions, disk_hits, disk_writes, disk_evictions, states_solved, updates, size, maxsize and hit_rate
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_hits": self.disk_hits,
+            "disk_writes": self.disk_writes,
+            "disk_evictions": self.cache.evictions if self.cache is not None else 0,
+            "states_solved": self.states_solved,
+            "updates": self.updates,
+            "size": len(self._tables),
+            "maxsize": self._maxsize,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+
+STORE = TableStore(cache_dir=os.environ.get("RL4PICKO_TABLE_CACHE"), cache_bytes=int(float(os.environ.get("RL4PICKO_TABLE_CACHE_MB", 256))*2**20))
+
+
+if __name__ == "__main__":
+
+    # States out of the turn graph (5 dice left with no choice made, with 8 dice) are solved by the recursion of
+    # Bellman: compare with a direct recursion over the dice outputs
+    from players import Player
+
+    player = Player()
+    table = STORE.get(player.table_key())
+
+    @functools.cache
+    def reference(choices: int, nb_available_dice: int, score: int) -> float:
+        res = 0.
+        for dice_output in all_possible_dice_outputs(nb_available_dice):
+            best = table.fail_reward if not any(count and not (choices >> face) & 1 for face, count in enumerate(dice_output)) else -np.inf
+            for face, count in enumerate(dice_output):
+                if count and not (choices >> face) & 1:
+                    new_choices, new_score = choices | (1 << face), score + FACE_VALUES[face]*count
+                    reward = reference(new_choices, nb_available_dice - count, new_score)
+                    best = max(best, reward, table.stop_rewards[new_score] if new_choices % 2 == 1 else -np.inf)
+            res += proba(dice_output, nb_available_dice)*best
+        return(res)
+
+    for state in [(0, 5, 0), (1, 4, 10), (6, 2, 12)]:
+        print(state, table.expectancy(*state), reference(*state))
+        assert abs(table.expectancy(*state) - reference(*state)) < 1e-12
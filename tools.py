@@ -1,7 +1,6 @@
 import functools
 import math
 import numpy as np
-import itertools
 N_FACES = 6
 
 @functools.cache
@@ -15,7 +14,6 @@ def fact(n: int):
 
 
 
-@functools.cache
 def proba(t : tuple,n : int):
     """Computes the probability of each state after drawing N dice
 
@@ -24,38 +22,148 @@ def proba(t : tuple,n : int):
     :param n: number of dice
     :type n: int
     """
-    if sum(t) != n:
+    index = dice_index(n)
+    if t not in index.ids:
         print("ERROR proba")
         return(0)
+    return(float(index.probas[index.ids[t]]))
+
 
-    rep = (fact(n)/(math.prod((fact(i) for i in t))))/(N_FACES**n)
-    return(rep)
 
+FACE_VALUES = np.array([5, 1, 2, 3, 4, 5])
+FACTORIALS = np.array([math.factorial(i) for i in range(21)], dtype=np.float64)
 
 
 @functools.cache
+def compositions(n: int, parts: int = N_FACES) -> np.ndarray:
+    """Computes all the tuples of parts non-negative integers whose sum is n, in lexicographic order
+
+    :param n: sum of the elements of the tuples
+    :type n: int
+    :param parts: length of the tuples
+    :type parts: int
+    :return: array of shape (M, parts)
+    :rtype: np.ndarray
+    """
+    if parts == 1:
+        return(np.array([[n]], dtype=np.int64))
+    blocks = []
+    for first in range(n + 1):
+        rest = compositions(n - first, parts - 1)
+        blocks.append(np.column_stack((np.full(len(rest), first, dtype=np.int64), rest)))
+    return(np.concatenate(blocks))
+
+
+class DiceIndex:
+    """Index of all the possible dice outputs with n dice.
+
+    Each output is identified by an integer id, its row in the arrays of the index.
+
+    :param n: number of dice
+    :type n: int
+    """
+
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self.outputs = compositions(n)# counts of each face, shape (M, N_FACES)
+        self.probas = FACTORIALS[n] / FACTORIALS[self.outputs].prod(axis=1) / N_FACES**n
+        self.scores = self.outputs * FACE_VALUES# score obtained by keeping each face, shape (M, N_FACES)
+        self.tuples = [tuple(t) for t in self.outputs.tolist()]
+        self.ids = {t: i for i, t in enumerate(self.tuples)}
+
+    def __len__(self) -> int:
+        return(len(self.tuples))
+
+
+@functools.cache
+def dice_index(n: int) -> DiceIndex:
+    """Returns the index of the dice outputs with n dice, built once per number of dice
+
+    :param n: number of dice
+    :type n: int
+    """
+    return(DiceIndex(n))
+
+
 def all_possible_dice_outputs(n : int):
     """Computes all possible dice outputs with n dice
 
     :param n: Number of dice available.
     :type n: int
     """
-    def generate_tuples(sum_value, tuple_length):
-        # Générer tous les tuples possibles
-        possible_tuples = itertools.product(range(sum_value+1), repeat=tuple_length)
-        
-        # Filtrer les tuples dont la somme des éléments est égale à sum_value (ie le nombre de dés à lancer)
-        valid_tuples = [t for t in possible_tuples if sum(t) == sum_value]
-        
-        return valid_tuples
-
-    return(generate_tuples(n, N_FACES))
+    return(dice_index(n).tuples)
 
 def draw_dice(n = 8):
     """Draws N dice and gives the result in state form
     """
     dice = np.random.randint(0, N_FACES, n)
-    return(dice2state(dice))
+    return(dice2state(dice.tolist()))
+
+def draw_dice_id(n = 8) -> int:
+    """Draws N dice and gives the id of the result in the index of the dice outputs
+    """
+    return(dice_index(n).ids[draw_dice(n)])
+
+class DiceSource:
+    """Source of dice throws drawing large blocks in advance from its own random generator.
+
+    For each number of dice, a block of throws is drawn at once and converted in bulk to ids in the
+    index of the dice outputs, so a throw costs a lookup instead of a call to the random generator and a
+    count of the faces. Each number of dice has its own block, hence the throws of a source only depend
+    on its seed and on the sequence of numbers of dice thrown.
+
+    Independent streams (per worker, per game) are obtained with spawn or by passing a SeedSequence with
+    a spawn key. Two sources with the same seed give the same throws, which is what common random numbers
+    experiments need.
+
+    :param seed: seed of the generator (int, SeedSequence or Generator), defaults to a seed drawn from np.random so that np.random.seed keeps the games reproducible
+    :type seed: int, optional
+    :param block_size: number of throws drawn at once for each number of dice
+    :type block_size: int
+    """
+
+    def __init__(self, seed = None, block_size: int = 4096) -> None:
+        if seed is None:
+            seed = np.random.randint(2**32, dtype=np.uint64)
+        self.rng = np.random.default_rng(seed)
+        self.block_size = block_size
+        self._ids = {}
+        self._pos = {}
+
+    def spawn(self, n: int) -> list:
+        """Returns n sources with independent streams"""
+        return([DiceSource(rng, self.block_size) for rng in self.rng.spawn(n)])
+
+    def _refill(self, n: int) -> np.ndarray:
+        index = dice_index(n)
+        rolls = self.rng.integers(0, N_FACES, (self.block_size, n), dtype=np.int8)
+        counts = (rolls[:, :, None] == np.arange(N_FACES, dtype=np.int8)).sum(axis=1)
+        # The outputs of the index are in lexicographic order, so are their codes in base n+1
+        radix = (n + 1)**np.arange(N_FACES - 1, -1, -1)
+        ids = np.searchsorted(index.outputs @ radix, counts @ radix).tolist()
+        self._ids[n] = ids
+        self._pos[n] = 0
+        return(ids)
+
+    def draw_id(self, n: int = 8) -> int:
+        """Draws n dice and gives the id of the result in the index of the dice outputs"""
+        pos = self._pos.get(n, self.block_size)
+        if pos >= self.block_size:
+            ids = self._refill(n)
+            pos = 0
+        else:
+            ids = self._ids[n]
+        self._pos[n] = pos + 1
+        return(ids[pos])
+
+    def draw(self, n: int = 8) -> tuple:
+        """Draws n dice and gives the result in state form, as draw_dice"""
+        return(dice_index(n).tuples[self.draw_id(n)])
+
+    def rolls(self, shape: tuple) -> np.ndarray:
+        """Draws raw faces (0 to N_FACES-1) of the given shape, used by the batched games"""
+        return(self.rng.integers(0, N_FACES, shape, dtype=np.int8))
+
 
 def dice2state(dice):
     """Transforms raw dice results into the usual representation 
@@ -0,0 +1,160 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from game import *
+from batch import BatchGame
+
+
+class PlayerConfig:
+    """Description of a player which can be sent to worker processes
+
+    :param cls: class of the player
+    :type cls: type
+    :param alpha: alpha of the player, only used by PlayerAB and its subclasses
+    :type alpha: float
+    :param beta: beta of the player, only used by PlayerAB and its subclasses
+    :type beta: float
+    """
+
+    def __init__(self, cls = PlayerAB, alpha = 1, beta = 1, N_dice = 8, domino_min = 21, domino_max = 36, r = [1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4]) -> None:
+        self.cls = cls
+        self.alpha = alpha
+        self.beta = beta
+        self.N_dice = N_dice
+        self.domino_min = domino_min
+        self.domino_max = domino_max
+        self.r = list(r)
+
+    def rules(self) -> tuple:
+        return (self.N_dice, self.domino_min, self.domino_max, tuple(self.r))
+
+    def build(self) -> Player:
+        """Creates the player described by the configuration"""
+        player = self.cls(N_dice=self.N_dice, domino_min=self.domino_min, domino_max=self.domino_max, r=self.r.copy())
+        if isinstance(player, PlayerAB):
+            player.set_ab(self.alpha, self.beta)
+        return player
+
+    def __repr__(self) -> str:
+        return f"PlayerConfig({self.cls.__name__}, alpha={self.alpha}, beta={self.beta})"
+
+
+def play_games(config: PlayerConfig, opponent: PlayerConfig, n_games: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """Plays n_games games of config (player A) against opponent (player B)
+
+    Games between two PlayerAB are played in lockstep by BatchGame, other players are played with Game.
+
+    :param seed: seed of the random stream of the games
+    :type seed: np.random.SeedSequence
+    :return: score difference (A - B) of each game
+    :rtype: np.ndarray
+    """
+    if config.rules() != opponent.rules():
+        raise ValueError("both players must use the same rules")
+    if config.cls is PlayerAB and opponent.cls is PlayerAB:
+        batch = BatchGame(n_games, alphas=(config.alpha, opponent.alpha), betas=(config.beta, opponent.beta),
+                          N_dice=config.N_dice, domino_min=config.domino_min, domino_max=config.domino_max, r=config.r,
+                          dice=DiceSource(seed))
+        batch.play_game()
+        return batch.score_difference()
+
+    game = Game(config.build(), opponent.build(), N_dice=config.N_dice, domino_min=config.domino_min, domino_max=config.domino_max, r=config.r,
+                dice=DiceSource(seed))
+    res = np.zeros(n_games)
+    for i in range(n_games):
+        game.reinit()
+        game.play_game(display=False)
+        res[i] = game.score('A') - game.score('B')
+    return res
+
+
+def _play_games_task(task):
+    config_idx, batch_idx, config, opponent, n_games, seed = task
+    return config_idx, batch_idx, play_games(config, opponent, n_games, seed)
+
+
+def summarize(score_differences: np.ndarray) -> dict:
+    """Aggregates the score differences of a player
+
+    :return: n_games, mean, std, sem (standard error of the mean), wins, draws and losses
+    :rtype: dict
+    """
+    n = len(score_differences)
+    std = float(score_differences.std(ddof=1)) if n > 1 else 0.0
+    return {
+        "n_games": n,
+        "mean": float(score_differences.mean()),
+        "std": std,
+        "sem": std / np.sqrt(n) if n else 0.0,
+        "wins": int((score_differences > 0).sum()),
+        "draws": int((score_differences == 0).sum()),
+        "losses": int((score_differences < 0).sum()),
+    }
+
+
+def run_tournament(configs: list, opponent: PlayerConfig, n_games: int, batch_size: int = 100, max_workers: int = None, seed: int = 0, return_scores: bool = False, common_random_numbers: bool = False) -> list:
+    """Plays n_games games of each configuration against the opponent, spread over a pool of processes.
+
+    The games of each configuration are split in batches. Each batch has its own random stream spawned
+    from the master seed and indexed by (configuration, batch), so the results only depend on the seed
+    and not on the number of workers or on the scheduling. With common random numbers, the streams are
+    only indexed by the batch: all the configurations play their games with the same dice, which reduces
+    the variance of the differences between configurations (games between two PlayerAB only).
+
+    :param configs: players evaluated, as player A
+    :type configs: list[PlayerConfig]
+    :param opponent: opponent of all the players, as player B
+    :type opponent: PlayerConfig
+    :param n_games: number of games per configuration
+    :type n_games: int
+    :param batch_size: number of games played by a task
+    :type batch_size: int
+    :param max_workers: number of processes, defaults to the number of CPUs. 0 plays all the games in this process
+    :type max_workers: int, optional
+    :param seed: master seed
+    :type seed: int
+    :param return_scores: also return the score difference of every game
+    :type return_scores: bool
+    :param common_random_numbers: play the games of all the configurations with the same random streams
+    :type common_random_numbers: bool
+    :return: statistics of the score difference of each configuration (see summarize), with the scores under "scores" if asked
+    :rtype: list[dict]
+    """
+    tasks = []
+    for config_idx, config in enumerate(configs):
+        for batch_idx, start in enumerate(range(0, n_games, batch_size)):
+            spawn_key = (batch_idx,) if common_random_numbers else (config_idx, batch_idx)
+            seq = np.random.SeedSequence(seed, spawn_key=spawn_key)
+            tasks.append((config_idx, batch_idx, config, opponent, min(batch_size, n_games - start), seq))
+
+    scores = [dict() for _ in configs]
+    if max_workers == 0:
+        for task in tasks:
+            config_idx, batch_idx, res = _play_games_task(task)
+            scores[config_idx][batch_idx] = res
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            for future in as_completed([executor.submit(_play_games_task, task) for task in tasks]):
+                config_idx, batch_idx, res = future.result()
+                scores[config_idx][batch_idx] = res
+
+    results = []
+    for batches in scores:
+        res = np.concatenate([batches[i] for i in sorted(batches)]) if batches else np.zeros(0)
+        stats = summarize(res)
+        if return_scores:
+            stats["scores"] = res
+        results.append(stats)
+    return results
+
+
+if __name__ == "__main__":
+
+    import time
+
+    configs = [PlayerConfig(alpha=a, beta=b) for a in (0.5, 1, 2) for b in (0.5, 1, 2)]
+    tic = time.time()
+    results = run_tournament(configs, PlayerConfig(), n_games=1000, seed=0)
+    print(f"{len(configs)*1000/(time.time() - tic):.0f} games/s")
+    for config, stats in zip(configs, results):
+        print(config, f"{stats['mean']:.3f} +/- {stats['sem']:.3f}")
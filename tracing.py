@@ -0,0 +1,147 @@
+from collections import deque
+import numpy as np
+
+# Events of a game. Each record is (event, values...) padded to RECORD_SIZE floats
+PLAYS = 0       # (side) side 0 is player A, side 1 is player B
+TURN = 1        # (C) C of the playing player at the beginning of the turn
+DICE = 2        # (count of each face)
+CHOICE = 3      # (face, 1 if the player continues else 0, expected reward)
+FAIL = 4        # (reward)
+STOP = 5        # (score)
+STATE = 6       # (grill bit mask, number of dominos of the grill, top domino of A, top domino of B)
+STEAL = 7       # (domino)
+TAKE = 8        # (domino)
+LOSE = 9        # (domino)
+LOSE_TURN = 10  # ()
+
+EVENT_NAMES = ["plays", "turn", "dice", "choice", "fail", "stop", "state", "steal", "take", "lose", "lose turn"]
+RECORD_SIZE = 8
+
+
+class RingBuffer:
+    """Keeps the last events in memory
+
+    :param capacity: maximum number of events kept
+    :type capacity: int
+    """
+
+    def __init__(self, capacity: int = 65536) -> None:
+        self.events = deque(maxlen=capacity)
+
+    def write(self, record: tuple) -> None:
+        self.events.append(record)
+
+    def records(self) -> np.ndarray:
+        """Returns the events kept, oldest first, as an array of shape (n, RECORD_SIZE)"""
+        return records2array(self.events)
+
+    def close(self) -> None:
+        pass
+
+
+class BinaryFile:
+    """Appends the events to a binary file of float64 records, written by batches
+
+    :param path: path of the file
+    :type path: str
+    :param batch_size: number of events buffered before writing
+    :type batch_size: int
+    """
+
+    def __init__(self, path: str, batch_size: int = 4096) -> None:
+        self.file = open(path, "ab")
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def write(self, record: tuple) -> None:
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.file.write(records2array(self.buffer).tobytes())
+            self.buffer = []
+        self.file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+class Tracer:
+    """Structured trace of the games.
+
+    The code on the hot path checks `TRACER.enabled` before building an event, so a disabled tracer
+    costs a single attribute lookup per event.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.sink = None
+
+    def enable(self, sink) -> None:
+        """Starts sending the events to the sink (RingBuffer or BinaryFile)"""
+        self.sink = sink
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Stops tracing and closes the sink"""
+        self.enabled = False
+        if self.sink is not None:
+            self.sink.close()
+        self.sink = None
+
+    def emit(self, event: int, *values) -> None:
+        self.sink.write((event,) + values)
+
+
+TRACER = Tracer()
+
+
+def records2array(records) -> np.ndarray:
+    res = np.zeros((len(records), RECORD_SIZE))
+    for i, record in enumerate(records):
+        res[i, :len(record)] = record
+    return res
+
+
+def read_trace(path: str) -> np.ndarray:
+    """Reads a binary trace file
+
+    :return: events of shape (n, RECORD_SIZE)
+    :rtype: np.ndarray
+    """
+    return np.fromfile(path, dtype=np.float64).reshape(-1, RECORD_SIZE)
+
+
+def format_event(record) -> str:
+    """Formats an event in a human readable way"""
+    event = int(record[0])
+    values = record[1:]
+    if event == PLAYS:
+        return "AB"[int(values[0])] + " plays"
+    if event == TURN:
+        return f"C at this turn: {values[0]}"
+    if event == DICE:
+        return f"dice: {tuple(int(v) for v in values[:6])}"
+    if event == CHOICE:
+        return f"chooses {(int(values[0]), int(values[1]))} with reward {values[2]}"
+    if event == FAIL:
+        return f"player fails, reward = {values[0]}"
+    if event == STOP:
+        return f"player stops, reward = {int(values[0])}"
+    if event == STATE:
+        grill = int(values[0])
+        return f"state: {''.join('X' if (grill >> i) & 1 else '.' for i in range(int(values[1])))}   {int(values[2]):<4}{int(values[3]):<4}"
+    if event == LOSE_TURN:
+        return "looses turn"
+    return f"{EVENT_NAMES[event]} {int(values[0])}"
+
+
+if __name__ == "__main__":
+
+    import sys
+
+    for record in read_trace(sys.argv[1] if len(sys.argv) > 1 else "game.trace"):
+        print(format_event(record))
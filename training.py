@@ -0,0 +1,232 @@
+import multiprocessing
+import time
+import numpy as np
+import torch
+import torch.optim as optim
+from torch.nn.utils import parameters_to_vector, vector_to_parameters
+from agent import *
+
+
+class ReplayBuffer:
+    """Ring buffer of transitions (state, reward, best alpha/beta, next state, done) in shared memory.
+
+    The arrays are allocated in RawArrays, so the buffer can be given to processes at their creation and
+    written by several actors while the learner samples it. A writer claims a slot under a lock then fills it
+    without holding the lock. Each slot has a commit marker, the number of the transition it holds, reset to -1
+    before the slot is written and set once the transition is complete: the learner only samples committed
+    slots, and drops the ones whose marker changed while it copied them, so it never reads a transition being
+    written, however long a writer holds its slot.
+
+    :param capacity: number of transitions kept, the oldest are overwritten
+    :type capacity: int
+    """
+
+    def __init__(self, capacity: int = 100000, context=None) -> None:
+        context = context or multiprocessing.get_context()
+        self.capacity = capacity
+        self._states = context.RawArray("f", capacity*STATE_SIZE)
+        self._next_states = context.RawArray("f", capacity*STATE_SIZE)
+        self._rewards = context.RawArray("f", capacity)
+        self._ab = context.RawArray("f", capacity*2)
+        self._done = context.RawArray("b", capacity)
+        self._markers = context.RawArray("q", capacity)
+        self.count = context.Value("q", 0)
+        self._views()
+        self.markers[:] = -1
+
+    def _views(self) -> None:
+        self.states = np.frombuffer(self._states, dtype=np.float32).reshape(self.capacity, STATE_SIZE)
+        self.next_states = np.frombuffer(self._next_states, dtype=np.float32).reshape(self.capacity, STATE_SIZE)
+        self.rewards = np.frombuffer(self._rewards, dtype=np.float32)
+        self.ab = np.frombuffer(self._ab, dtype=np.float32).reshape(self.capacity, 2)
+        self.done = np.frombuffer(self._done, dtype=np.int8)
+        self.markers = np.frombuffer(self._markers, dtype=np.int64)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for name in ("states", "next_states", "rewards", "ab", "done", "markers"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._views()
+
+    def __len__(self) -> int:
+        """Number of committed transitions"""
+        return int(np.count_nonzero(self.markers >= 0))
+
+    def add(self, state: np.ndarray, reward: float, ab: tuple, next_state: np.ndarray, done: bool) -> None:
+        with self.count.get_lock():
+            number = self.count.value
+            self.count.value += 1
+        i = number % self.capacity
+        self.markers[i] = -1
+        self.states[i] = state
+        self.rewards[i] = reward
+        self.ab[i] = ab
+        self.next_states[i] = next_state
+        self.done[i] = done
+        self.markers[i] = number
+
+    def sample(self, batch_size: int, rng: np.random.Generator) -> Tuple[torch.Tensor, ...]:
+        """Samples a mini-batch among the committed transitions
+
+        The transitions overwritten while they are copied are dropped, so the mini-batch may be slightly smaller
+        than batch_size.
+
+        :return: states, rewards, best (alpha, beta), next states and done flags as tensors
+        :rtype: Tuple[torch.Tensor, ...]
+        """
+        committed = np.flatnonzero(self.markers >= 0)
+        if len(committed) == 0:
+            raise ValueError("not enough transitions in the buffer")
+        idx = committed[rng.integers(len(committed), size=batch_size)]
+        markers = self.markers[idx]
+        states, rewards, ab, next_states, done = self.states[idx], self.rewards[idx], self.ab[idx], self.next_states[idx], self.done[idx]
+        # A slot claimed again during the copy has a new marker (or -1 while it is written)
+        valid = self.markers[idx] == markers
+        return (torch.from_numpy(states[valid]), torch.from_numpy(rewards[valid]), torch.from_numpy(ab[valid]),
+                torch.from_numpy(next_states[valid]), torch.from_numpy(done[valid].astype(np.float32)))
+
+
+class SharedWeights:
+    """Parameters of a network in shared memory with a version number, broadcast by the learner to the actors"""
+
+    def __init__(self, net: nn.Module, context=None) -> None:
+        context = context or multiprocessing.get_context()
+        n = sum(parameter.numel() for parameter in net.parameters())
+        self._vector = context.RawArray("f", n)
+        self.version = context.Value("q", 0)
+        self.publish(net)
+
+    def vector(self) -> np.ndarray:
+        return np.frombuffer(self._vector, dtype=np.float32)
+
+    def publish(self, net: nn.Module) -> None:
+        with self.version.get_lock():
+            self.vector()[:] = parameters_to_vector(net.parameters()).detach().numpy()
+            self.version.value += 1
+
+    def load(self, net: nn.Module) -> int:
+        """Copies the weights in net and returns their version"""
+        with self.version.get_lock():
+            vector_to_parameters(torch.from_numpy(self.vector().copy()), net.parameters())
+            return self.version.value
+
+
+def actor_worker(buffer: ReplayBuffer, weights: SharedWeights, stop, seed: np.random.SeedSequence, stats) -> None:
+    """Plays games with the last weights published and writes the transitions in the buffer
+
+    At each turn of the agent, its (alpha, beta) are given by the network, the turn of the agent and the turn of
+    the adversary are played, and the best (alpha, beta) of the position is found by Agent.grid_search.
+    """
+    torch.set_num_threads(1)
+    agent = Agent(Actor())
+    # The dice of the game and of the grid search rollouts come from independent streams, so the labels do not
+    # depend on the dice the game rolls next
+    game_seed, search_seed = seed.spawn(2)
+    agent.game.dice = DiceSource(game_seed)
+    agent.rng = np.random.default_rng(search_seed)
+    version = weights.load(agent.net)
+    encoder = StateEncoder()
+    while not stop.is_set():
+        agent.game.reinit()
+        while not agent.game.over() and not stop.is_set():
+            if weights.version.value != version:
+                version = weights.load(agent.net)
+            state = encoder.encode(agent.game.grill, agent.me.dominos, agent.adv.dominos).numpy().copy()
+            with torch.inference_mode():
+                alpha, beta, _ = agent.net(torch.from_numpy(state))
+            agent.me.set_ab(alpha.item(), beta.item())
+            values = agent.grid_search(GRID, GRID)
+            best_idx, best_jdx = np.unravel_index(np.argmax(values), values.shape)
+
+            reward = agent.game.play_turn(agent.me, agent.adv)
+            if not agent.game.over():
+                reward -= agent.game.play_turn(agent.adv, agent.me)
+            next_state = encoder.encode(agent.game.grill, agent.me.dominos, agent.adv.dominos).numpy()
+            buffer.add(state, reward, (GRID[best_idx], GRID[best_jdx]), next_state, agent.game.over())
+            with stats.get_lock():
+                stats.value += 1
+
+
+def learn(net: Actor, buffer: ReplayBuffer, weights: SharedWeights, n_steps: int, batch_size: int = 64, broadcast_interval: int = 10, warmup: int = 64, lr: float = LR, seed: int = 0) -> list:
+    """Trains the network on mini-batches sampled from the buffer while the actors fill it
+
+    The value head is trained on the temporal difference target reward + GAMMA*value(next state), the next value
+    being computed without gradient and 0 at the end of the game, and the alpha and beta heads on the best
+    (alpha, beta) found by the actors. The first step waits for warmup transitions in the buffer.
+
+    :return: loss of each step
+    :rtype: list
+    """
+    rng = np.random.default_rng(seed)
+    optimizer = optim.SGD(net.parameters(), lr=lr)
+    losses = []
+    while len(buffer) < max(warmup, 1):
+        time.sleep(0.01)
+    for step in range(n_steps):
+        states, rewards, ab, next_states, done = buffer.sample(batch_size, rng)
+        alpha, beta, value = net(states)
+        with torch.no_grad():
+            _, _, next_value = net(next_states)
+            target = rewards + GAMMA*next_value[:, 0]*(1 - done)
+        loss = ((target - value[:, 0])**2).mean() + LOSS_AB*(((alpha[:, 0] - ab[:, 0])**2).mean() + ((beta[:, 0] - ab[:, 1])**2).mean())
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        losses.append(loss.item())
+        if (step + 1) % broadcast_interval == 0:
+            weights.publish(net)
+    weights.publish(net)
+    return losses
+
+
+def train(n_actors: int = None, n_steps: int = 1000, capacity: int = 100000, batch_size: int = 64, broadcast_interval: int = 10, warmup: int = 64, seed: int = 0) -> Tuple[Actor, list, int]:
+    """Trains an Actor with n_actors processes generating transitions while this process learns
+
+    :param n_actors: number of actor processes, defaults to the number of CPUs minus one (at least 1)
+    :type n_actors: int, optional
+    :param n_steps: number of optimization steps
+    :type n_steps: int
+    :param capacity: size of the replay buffer
+    :type capacity: int
+    :param batch_size: size of the mini-batches
+    :type batch_size: int
+    :param broadcast_interval: number of steps between two broadcasts of the weights
+    :type broadcast_interval: int
+    :param warmup: number of transitions generated before the first step
+    :type warmup: int
+    :return: network, losses and number of transitions generated
+    :rtype: Tuple[Actor, list, int]
+    """
+    n_actors = n_actors or max(1, multiprocessing.cpu_count() - 1)
+    context = multiprocessing.get_context()
+    torch.manual_seed(seed)
+    net = Actor()
+    buffer = ReplayBuffer(capacity, context)
+    weights = SharedWeights(net, context)
+    stop = context.Event()
+    stats = context.Value("q", 0)
+    seeds = np.random.SeedSequence(seed).spawn(n_actors)
+    actors = [context.Process(target=actor_worker, args=(buffer, weights, stop, seeds[i], stats), daemon=True) for i in range(n_actors)]
+    for actor in actors:
+        actor.start()
+    try:
+        losses = learn(net, buffer, weights, n_steps, batch_size, broadcast_interval, warmup, seed=seed)
+    finally:
+        stop.set()
+        for actor in actors:
+            actor.join()
+    return net, losses, stats.value
+
+
+if __name__ == "__main__":
+
+    tic = time.time()
+    net, losses, n_transitions = train(n_steps=500)
+    duration = time.time() - tic
+    print(f"{n_transitions} transitions and {len(losses)} steps in {duration:.1f}s ({n_transitions/duration:.1f} transitions/s)")
+    print(f"loss: first {np.mean(losses[:50]):.3f}, last {np.mean(losses[-50:]):.3f}")
+    torch.save(net.state_dict(), "actor.pt")